@@ -0,0 +1,127 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authentication import TokenAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from users.models import User
+
+# TOKEN_AUTH_CACHE['CACHE'] value for LocalTokenCache.
+LOCAL_CACHE = 'local'
+
+
+class LocalTokenCache:
+    """Bounded LRU of tokens with their users kept in process memory.
+
+    Invalidation only reaches the process that handled the change,
+    other workers may keep a stale entry for up to TTL seconds, so it
+    is only safe with a single worker.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._tokens = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            token, expires_at = self._tokens.get(key, (None, 0))
+            if expires_at < time.monotonic():
+                self._tokens.pop(key, None)
+                return None
+            self._tokens.move_to_end(key)
+            return token
+
+    def set(self, key, token):
+        with self._lock:
+            self._tokens[key] = (token, time.monotonic() + self.ttl)
+            self._tokens.move_to_end(key)
+            while len(self._tokens) > self.max_size:
+                self._tokens.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._tokens.pop(key, None)
+
+
+class SharedTokenCache:
+    """Tokens with their users kept in a Django cache shared by workers."""
+    prefix = 'auth-token:'
+
+    def __init__(self, alias, ttl):
+        self.cache = caches[alias]
+        self.ttl = ttl
+
+    def get(self, key):
+        return self.cache.get(self.prefix + key)
+
+    def set(self, key, token):
+        self.cache.set(self.prefix + key, token, self.ttl)
+
+    def delete_many(self, keys):
+        self.cache.delete_many([self.prefix + key for key in keys])
+
+
+_token_cache = None
+
+
+def get_token_cache():
+    global _token_cache
+    if _token_cache is None:
+        options = settings.TOKEN_AUTH_CACHE
+        if options['CACHE'] == LOCAL_CACHE:
+            _token_cache = LocalTokenCache(options['MAX_SIZE'],
+                                           options['TTL'])
+        else:
+            _token_cache = SharedTokenCache(options['CACHE'], options['TTL'])
+    return _token_cache
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication that skips the token query for cached keys.
+
+    Entries are dropped when the token is deleted (logout) and when
+    the user is saved, which covers password changes and deactivation.
+    """
+
+    def authenticate_credentials(self, key):
+        cache = get_token_cache()
+        token = cache.get(key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(key, token)
+        # Callers may modify request.user, never hand out the cached one.
+        token = copy.copy(token)
+        token.user = copy.copy(token.user)
+        return token.user, token
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """JWT authentication that builds the user from token claims.
+
+    No query is made: the user has only id, is_staff and is_active
+    loaded, other fields are fetched from the database on access.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(
+                'Token contained no recognizable user identification')
+        loaded = {'id': user_id,
+                  'is_staff': validated_token.get('is_staff', False),
+                  'is_active': True}
+        fields = [field.attname for field in User._meta.concrete_fields
+                  if field.attname in loaded]
+        return User.from_db(DEFAULT_DB_ALIAS, fields,
+                            [loaded[field] for field in fields])
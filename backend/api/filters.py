@@ -1,6 +1,16 @@
+from django import forms
 from django_filters.rest_framework import FilterSet, filters
+from rest_framework.exceptions import ValidationError
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import ExclusionProfile, Ingredient, Recipe, Tag
+
+
+class IntegerFilter(filters.NumberFilter):
+    field_class = forms.IntegerField
+
+
+class IntegerInFilter(filters.BaseInFilter, IntegerFilter):
+    pass
 
 
 class RecipeFilter(FilterSet):
@@ -12,10 +22,22 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method="get_is_in_shopping_cart")
     author = filters.CharFilter(field_name="author_id")
+    cooking_time_min = filters.NumberFilter(
+        field_name="cooking_time", lookup_expr="gte")
+    cooking_time_max = filters.NumberFilter(
+        field_name="cooking_time", lookup_expr="lte")
+    max_ingredients = filters.NumberFilter(
+        field_name="ingredients_count", lookup_expr="lte")
+    exclude_ingredients = IntegerInFilter(method="get_exclude_ingredients")
+    exclusion_profile = IntegerFilter(method="get_exclusion_profile")
+    with_ingredients = IntegerInFilter(method="get_with_ingredients")
 
     class Meta:
         model = Recipe
-        fields = ("tags", "author", "is_favorited", "is_in_shopping_cart")
+        fields = ("tags", "author", "is_favorited", "is_in_shopping_cart",
+                  "cooking_time_min", "cooking_time_max", "max_ingredients",
+                  "exclude_ingredients", "exclusion_profile",
+                  "with_ingredients")
 
     def get_is_favorited(self, queryset, key, value):
         user = self.request.user
@@ -29,6 +51,28 @@ class RecipeFilter(FilterSet):
             return queryset.filter(shoppinglist_recipe__user=user)
         return queryset
 
+    def get_exclude_ingredients(self, queryset, key, value):
+        # NOT && is checked on the stored ids of every row without a
+        # join, so the list still walks the ordering index and stops at
+        # the page limit.
+        return queryset.exclude(ingredient_ids__overlap=value)
+
+    def get_with_ingredients(self, queryset, key, value):
+        # @> is answered by the GIN index.
+        return queryset.filter(ingredient_ids__contains=value)
+
+    def get_exclusion_profile(self, queryset, key, value):
+        user = self.request.user
+        ingredients = list(ExclusionProfile.objects.filter(
+            pk=value, user_id=user.id).values_list("ingredients", flat=True))
+        if not ingredients:
+            raise ValidationError(
+                {"exclusion_profile": "Exclusion profile does not exist."})
+        ingredients = [pk for pk in ingredients if pk is not None]
+        if not ingredients:
+            return queryset
+        return queryset.exclude(ingredient_ids__overlap=ingredients)
+
 
 class IngredientFilter(FilterSet):
     name = filters.CharFilter(lookup_expr="icontains")
@@ -0,0 +1,411 @@
+import itertools
+import json
+import random
+import statistics
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import get_resolver, resolve
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+BENCHMARK_EMAIL = 'benchmark@benchmark.foodgram.local'
+BENCHMARK_ADMIN_EMAIL = 'benchmark-admin@benchmark.foodgram.local'
+BENCHMARK_AUTH_EMAIL = 'benchmark-auth@benchmark.foodgram.local'
+BENCHMARK_PASSWORD = 'benchmark-password'
+SIGNUP_DOMAIN = 'signup.benchmark.foodgram.local'
+IMAGE = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJ'
+         'AAAADUlEQVR42mP8z8DwHwAFBQIAX8jx0gAAAABJRU5ErkJggg==')
+
+# Routes without a scenario, by URL name, None for every method.
+NOT_BENCHMARKED = {
+    # Index of the browsable API.
+    'api-root': None,
+    # djoser routes shadowed by CustomUserViewSet.
+    'user-list': None,
+    'user-me': None,
+    'user-set-password': None,
+    'user-detail': None,
+    # Account changes confirmed by email.
+    'user-activation': None,
+    'user-resend-activation': None,
+    'user-reset-password': None,
+    'user-reset-password-confirm': None,
+    'user-set-username': None,
+    'user-reset-username': None,
+    'user-reset-username-confirm': None,
+    # Changing and deleting other accounts.
+    'users-detail': ('put', 'patch', 'delete'),
+}
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark every API route and print the results as JSON'
+    sequence = itertools.count()
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--only', nargs='*', default=None,
+                            help='Names of scenarios to run.')
+        parser.add_argument('--output', help='Write JSON to this file.')
+
+    def handle(self, *args, **options):
+        if not Recipe.objects.exists():
+            raise CommandError(
+                'No recipes found, run generate_sample_data first.')
+        rng = random.Random(options['seed'])
+        user = self.get_user(BENCHMARK_EMAIL, 'benchmark')
+        self.get_user(BENCHMARK_AUTH_EMAIL, 'benchmark-auth')
+        admin = self.get_user(BENCHMARK_ADMIN_EMAIL, 'benchmark-admin',
+                              is_staff=True)
+        clients = {
+            'user': self.get_client(user),
+            'admin': self.get_client(admin),
+            'anonymous': Client(raise_request_exception=False),
+        }
+
+        scenarios = self.get_scenarios(rng, user)
+        self.check_routes(scenarios)
+        results = {}
+        self.delete_signups()
+        try:
+            with override_settings(ALLOWED_HOSTS=['*']):
+                for name, requests in scenarios:
+                    if options['only'] and name not in options['only']:
+                        continue
+                    results.update(self.run_scenario(
+                        name, requests, clients, options))
+        finally:
+            self.delete_signups()
+
+        report = {
+            'commit': self.get_commit(),
+            'database': connections['default'].vendor,
+            'dataset': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'ingredients': Ingredient.objects.count(),
+            },
+            'iterations': options['iterations'],
+            'results': results,
+        }
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+    def get_user(self, email, username, is_staff=False):
+        user, created = User.objects.get_or_create(
+            email=email,
+            defaults={'username': username, 'first_name': 'Benchmark',
+                      'last_name': 'User', 'is_staff': is_staff})
+        if created:
+            if is_staff:
+                user.set_unusable_password()
+            else:
+                user.set_password(BENCHMARK_PASSWORD)
+            user.save()
+        return user
+
+    @staticmethod
+    def get_client(user):
+        client = Client(raise_request_exception=False)
+        client.defaults['HTTP_AUTHORIZATION'] = (
+            f'Token {Token.objects.get_or_create(user=user)[0].key}')
+        return client
+
+    @staticmethod
+    def delete_signups():
+        User.objects.filter(email__endswith=f'@{SIGNUP_DOMAIN}').delete()
+
+    @staticmethod
+    def get_routes():
+        """(URL name, method) of every API route."""
+        routes = set()
+        for pattern in get_resolver('api.urls').url_patterns:
+            patterns = getattr(pattern, 'url_patterns', [pattern])
+            for pattern in patterns:
+                callback = pattern.callback
+                methods = getattr(callback, 'actions', None)
+                if methods is None:
+                    view = callback.view_class
+                    methods = [method for method in view.http_method_names
+                               if method not in ('head', 'options')
+                               and hasattr(view, method)]
+                routes.update((pattern.name, method) for method in methods)
+        return routes
+
+    def check_routes(self, scenarios):
+        """Fail when an API route has no scenario."""
+        covered = set()
+        for _, requests in scenarios:
+            for _, _, method, path, _ in requests:
+                match = resolve(path.format(created=0).split('?')[0])
+                covered.add((match.url_name, method))
+        missing = sorted(
+            f'{method.upper()} {name}'
+            for name, method in self.get_routes() - covered
+            if name not in NOT_BENCHMARKED
+            or NOT_BENCHMARKED[name] is not None
+            and method not in NOT_BENCHMARKED[name])
+        if missing:
+            raise CommandError(
+                f'Routes without a scenario: {", ".join(missing)}')
+
+    @staticmethod
+    def get_commit():
+        try:
+            return subprocess.run(
+                ('git', 'rev-parse', 'HEAD'), cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def get_scenarios(self, rng, user):
+        """Return (name, requests) pairs, one request per route.
+
+        A request is (name, client, method, path, data); requests of a
+        scenario run in order on every iteration, so state changing
+        routes are paired with the request undoing them. {created},
+        {token} and {refresh} in paths and data take the ID and tokens
+        returned earlier in the iteration, {n} a number unique per run;
+        the 'token' client authenticates with {token}.
+        """
+        recipe = rng.choice(list(
+            Recipe.objects.exclude(author=user).values_list('id', flat=True)))
+        author = rng.choice(list(User.objects.exclude(
+            id=user.id).values_list('id', flat=True)))
+        recipes = rng.sample(list(Recipe.objects.exclude(
+            author=user).values_list('id', flat=True)[:100]), 2)
+        tag = Tag.objects.first()
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        ingredient = Ingredient.objects.first()
+        recipe_data = {
+            'tags': [tag.id],
+            'ingredients': [{'id': ingredient.id, 'amount': 10}],
+            'name': 'Benchmark recipe',
+            'image': IMAGE,
+            'text': 'Benchmark recipe description',
+            'cooking_time': 10,
+        }
+        login = {'email': BENCHMARK_AUTH_EMAIL,
+                 'password': BENCHMARK_PASSWORD}
+        password = {'new_password': BENCHMARK_PASSWORD,
+                    'current_password': BENCHMARK_PASSWORD}
+        signup = {'email': f'user-{{n}}@{SIGNUP_DOMAIN}',
+                  'username': 'signup-{n}', 'first_name': 'Benchmark',
+                  'last_name': 'User', 'password': BENCHMARK_PASSWORD}
+        profile = {'name': 'Benchmark profile',
+                   'ingredients': [ingredient.id]}
+        scenarios = (
+            ('users-list', (
+                ('users-list', 'anonymous', 'get', '/api/users/', None),)),
+            ('users-signup', (
+                ('users-signup', 'anonymous', 'post', '/api/users/',
+                 signup),)),
+            ('users-detail', (
+                ('users-detail', 'anonymous', 'get',
+                 f'/api/users/{author}/', None),)),
+            ('users-me', (
+                ('users-me', 'user', 'get', '/api/users/me/', None),
+                ('users-me-update', 'user', 'patch', '/api/users/me/',
+                 {'first_name': 'Benchmark'}))),
+            ('users-subscriptions', (
+                ('users-subscriptions', 'user', 'get',
+                 '/api/users/subscriptions/?recipes_limit=3', None),)),
+            ('users-subscribe', (
+                ('users-subscribe-add', 'user', 'post',
+                 f'/api/users/{author}/subscribe/', None),
+                ('users-subscribe-remove', 'user', 'delete',
+                 f'/api/users/{author}/subscribe/', None))),
+            ('users-set-password', (
+                ('users-set-password', 'user', 'post',
+                 '/api/users/set_password/', password),)),
+            ('tags-list', (
+                ('tags-list', 'anonymous', 'get', '/api/tags/', None),)),
+            ('tags-detail', (
+                ('tags-detail', 'anonymous', 'get',
+                 f'/api/tags/{tag.id}/', None),)),
+            ('ingredients-list', (
+                ('ingredients-list', 'anonymous', 'get',
+                 '/api/ingredients/', None),)),
+            ('ingredients-search', (
+                ('ingredients-search', 'anonymous', 'get',
+                 '/api/ingredients/?name=мол', None),)),
+            ('ingredients-detail', (
+                ('ingredients-detail', 'anonymous', 'get',
+                 f'/api/ingredients/{ingredient.id}/', None),)),
+            ('recipes-list', (
+                ('recipes-list-anonymous', 'anonymous', 'get',
+                 '/api/recipes/', None),
+                ('recipes-list', 'user', 'get', '/api/recipes/', None))),
+            ('recipes-filter', (
+                ('recipes-filter', 'user', 'get',
+                 f'/api/recipes/?tags={tag.slug}&is_favorited=1&limit=6',
+                 None),)),
+            ('recipes-detail', (
+                ('recipes-detail', 'user', 'get',
+                 f'/api/recipes/{recipe}/', None),)),
+            ('recipes-write', (
+                ('recipes-create', 'user', 'post', '/api/recipes/',
+                 recipe_data),
+                ('recipes-update', 'user', 'patch',
+                 '/api/recipes/{created}/', recipe_data),
+                ('recipes-replace', 'user', 'put',
+                 '/api/recipes/{created}/', recipe_data),
+                ('recipes-delete', 'user', 'delete',
+                 '/api/recipes/{created}/', None))),
+            ('recipes-favorite', (
+                ('recipes-favorite-add', 'user', 'post',
+                 f'/api/recipes/{recipe}/favorite/', None),
+                ('recipes-favorite-remove', 'user', 'delete',
+                 f'/api/recipes/{recipe}/favorite/', None))),
+            ('recipes-shopping-cart', (
+                ('recipes-shopping-cart-add', 'user', 'post',
+                 f'/api/recipes/{recipe}/shopping_cart/', None),
+                ('recipes-download-shopping-cart', 'user', 'get',
+                 '/api/recipes/download_shopping_cart/', None),
+                ('recipes-shopping-cart-remove', 'user', 'delete',
+                 f'/api/recipes/{recipe}/shopping_cart/', None))),
+            ('recipes-favorite-batch', (
+                ('recipes-favorite-batch-add', 'user', 'post',
+                 '/api/recipes/favorite/', {'ids': recipes}),
+                ('recipes-favorite-batch-remove', 'user', 'delete',
+                 '/api/recipes/favorite/', {'ids': recipes}))),
+            ('recipes-shopping-cart-batch', (
+                ('recipes-shopping-cart-batch-add', 'user', 'post',
+                 '/api/recipes/shopping_cart/', {'ids': recipes}),
+                ('recipes-shopping-cart-clear', 'user', 'delete',
+                 '/api/recipes/shopping_cart/clear/', None),
+                ('recipes-shopping-cart-batch-remove', 'user', 'delete',
+                 '/api/recipes/shopping_cart/', {'ids': recipes}))),
+            ('recipes-similar', (
+                ('recipes-similar', 'user', 'get',
+                 f'/api/recipes/{recipe}/similar/', None),)),
+            ('recipes-meal-plan', (
+                ('recipes-meal-plan', 'user', 'post',
+                 '/api/recipes/meal_plan/', {'tags': tags, 'days': 3}),)),
+            ('exclusion-profiles', (
+                ('exclusion-profiles-create', 'user', 'post',
+                 '/api/exclusion_profiles/', profile),
+                ('exclusion-profiles-list', 'user', 'get',
+                 '/api/exclusion_profiles/', None),
+                ('exclusion-profiles-detail', 'user', 'get',
+                 '/api/exclusion_profiles/{created}/', None),
+                ('exclusion-profiles-update', 'user', 'patch',
+                 '/api/exclusion_profiles/{created}/', profile),
+                ('exclusion-profiles-replace', 'user', 'put',
+                 '/api/exclusion_profiles/{created}/', profile),
+                ('exclusion-profiles-delete', 'user', 'delete',
+                 '/api/exclusion_profiles/{created}/', None))),
+            ('sync', (
+                ('sync-anonymous', 'anonymous', 'get', '/api/sync/', None),
+                ('sync', 'user', 'get', '/api/sync/', None))),
+            ('catalogue', (
+                ('catalogue', 'anonymous', 'get', '/api/catalogue/', None),)),
+            ('metrics', (
+                ('metrics', 'admin', 'get', '/api/metrics/', None),)),
+            ('auth-token', (
+                ('auth-token-login', 'anonymous', 'post',
+                 '/api/auth/token/login/', login),
+                ('auth-token-logout', 'token', 'post',
+                 '/api/auth/token/logout/', None))),
+        )
+        if settings.JWT_AUTH_ENABLED:
+            scenarios += (
+                ('auth-jwt', (
+                    ('auth-jwt-create', 'anonymous', 'post',
+                     '/api/auth/jwt/create/', login),
+                    ('auth-jwt-refresh', 'anonymous', 'post',
+                     '/api/auth/jwt/refresh/', {'refresh': '{refresh}'}),
+                    ('auth-jwt-logout', 'anonymous', 'post',
+                     '/api/auth/jwt/logout/', {'refresh': '{refresh}'}))),
+            )
+        return scenarios
+
+    def run_scenario(self, name, requests, clients, options):
+        timings = {request[0]: [] for request in requests}
+        queries = {request[0]: [] for request in requests}
+        statuses = {request[0]: {} for request in requests}
+        total = options['warmup'] + options['iterations']
+        started = None
+        for iteration in range(total):
+            if iteration == options['warmup']:
+                started = time.perf_counter()
+            context = {'created': None, 'token': None, 'refresh': None,
+                       'n': next(self.sequence)}
+            for request_name, who, method, path, data in requests:
+                path = path.format(**context)
+                if isinstance(data, dict):
+                    data = {key: (value.format(**context)
+                                  if isinstance(value, str) else value)
+                            for key, value in data.items()}
+                extra = {}
+                if who == 'token':
+                    who = 'anonymous'
+                    extra['HTTP_AUTHORIZATION'] = f'Token {context["token"]}'
+                with CaptureQueriesContext(connections['default']) as ctx:
+                    start = time.perf_counter()
+                    response = getattr(clients[who], method)(
+                        path, data, content_type='application/json', **extra)
+                    elapsed = time.perf_counter() - start
+                self.update_context(context, method, response)
+                if iteration < options['warmup']:
+                    continue
+                timings[request_name].append(elapsed * 1000)
+                queries[request_name].append(len(ctx.captured_queries))
+                status = statuses[request_name]
+                status[response.status_code] = (
+                    status.get(response.status_code, 0) + 1)
+        wall_time = time.perf_counter() - started
+
+        results = {}
+        for request_name, values in timings.items():
+            results[request_name] = {
+                'scenario': name,
+                'throughput_rps': round(len(values) / wall_time, 2),
+                'latency_ms': {
+                    'mean': round(statistics.fmean(values), 3),
+                    'p50': round(percentile(values, 50), 3),
+                    'p90': round(percentile(values, 90), 3),
+                    'p99': round(percentile(values, 99), 3),
+                    'max': round(max(values), 3),
+                },
+                'queries': {
+                    'mean': round(statistics.fmean(queries[request_name]), 2),
+                    'max': max(queries[request_name]),
+                },
+                'status_codes': statuses[request_name],
+            }
+        return results
+
+    @staticmethod
+    def update_context(context, method, response):
+        if not response.content or not response.get(
+                'Content-Type', '').startswith('application/json'):
+            return
+        payload = response.json()
+        if not isinstance(payload, dict):
+            return
+        if response.status_code == 201 and method == 'post':
+            context['created'] = payload.get('id')
+        for key, name in (('auth_token', 'token'), ('refresh', 'refresh')):
+            if key in payload:
+                context[name] = payload[key]
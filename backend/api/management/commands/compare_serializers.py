@@ -0,0 +1,124 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from rest_framework.mixins import ListModelMixin
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.renderers import FastJSONRenderer
+from api.views import RecipeViewSet
+from recipes.models import Recipe, Tag
+from users.models import User
+
+from .benchmark_api import percentile
+
+RENDERER_SAMPLE = {
+    'text': 'Строка с \u2028 и \u2029, "кавычками", \\ и \t\n\x00\x1f\x7f',
+    'emoji': '\U0001F957',
+    'numbers': [0, -1, 2 ** 62, True, False, None],
+    'nested': [{'id': 1, 'name': ''}, []],
+}
+
+
+class SerializerRecipeViewSet(RecipeViewSet):
+    """The recipe list as served through RecipeListSerializer."""
+    renderer_classes = (JSONRenderer,)
+    list = ListModelMixin.list
+
+
+class Command(BaseCommand):
+    help = ('Check that the fast recipe list returns the same bytes as '
+            'RecipeListSerializer and compare their speed')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+
+    def handle(self, *args, **options):
+        if not Recipe.objects.exists():
+            raise CommandError(
+                'No recipes found, run generate_sample_data first.')
+        fast_view = RecipeViewSet.as_view({'get': 'list'})
+        slow_view = SerializerRecipeViewSet.as_view({'get': 'list'})
+        user = (User.objects.filter(favorite_user__isnull=False).first()
+                or User.objects.first())
+        tag = Tag.objects.first()
+        cases = (
+            ('anonymous', None, '/api/recipes/'),
+            ('user', user, '/api/recipes/'),
+            ('user-page-50', user, '/api/recipes/?limit=50&page=2'),
+            ('user-favorited', user, '/api/recipes/?is_favorited=1'),
+            ('user-tag', user, f'/api/recipes/?tags={tag.slug}&limit=20'),
+            ('user-sparse', user,
+             '/api/recipes/?fields=id,name,tags,author,ingredients,'
+             'is_favorited&expand=tags&limit=20'),
+        )
+        mismatches = []
+        results = {}
+        for name, who, path in cases:
+            slow = self.measure(slow_view, who, path, options['iterations'])
+            fast = self.measure(fast_view, who, path, options['iterations'])
+            if slow['content'] != fast['content']:
+                mismatches.append(name)
+            results[name] = {
+                'identical': slow['content'] == fast['content'],
+                'bytes': len(fast['content']),
+                'serializer': slow['stats'],
+                'fast': fast['stats'],
+                'speedup': round(slow['stats']['mean_ms']
+                                 / fast['stats']['mean_ms'], 2),
+            }
+        renderers = self.compare_renderers(options['iterations'])
+        if not renderers['identical']:
+            mismatches.append('renderer')
+        self.stdout.write(json.dumps(
+            {'cases': results, 'renderer': renderers}, indent=2))
+        if mismatches:
+            raise CommandError(f'Output differs: {", ".join(mismatches)}')
+
+    @staticmethod
+    def measure(view, user, path, iterations):
+        factory = APIRequestFactory()
+        timings, queries, content = [], [], None
+
+        def count_query(execute, sql, params, many, context):
+            queries[-1] += 1
+            return execute(sql, params, many, context)
+
+        for _ in range(iterations):
+            request = factory.get(path)
+            if user is not None:
+                force_authenticate(request, user)
+            queries.append(0)
+            with connections['default'].execute_wrapper(count_query):
+                start = time.perf_counter()
+                response = view(request)
+                response.render()
+                timings.append((time.perf_counter() - start) * 1000)
+            content = response.content
+        return {'content': content, 'stats': {
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'p90_ms': round(percentile(timings, 90), 3),
+            'queries': max(queries),
+        }}
+
+    @staticmethod
+    def compare_renderers(iterations):
+        """Render a large page with both renderers."""
+        data = {'count': 1, 'next': None, 'previous': None,
+                'results': [RENDERER_SAMPLE] * 500}
+        timings = {}
+        output = {}
+        for renderer in (JSONRenderer(), FastJSONRenderer()):
+            name = type(renderer).__name__
+            start = time.perf_counter()
+            for _ in range(iterations):
+                output[name] = renderer.render(data)
+            timings[name] = round(
+                (time.perf_counter() - start) * 1000 / iterations, 3)
+        return {
+            'identical': len(set(output.values())) == 1,
+            'mean_ms': timings,
+        }
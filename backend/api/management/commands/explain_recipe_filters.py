@@ -0,0 +1,68 @@
+import json
+import re
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.fast_serializers import recipe_rows
+from api.filters import RecipeFilter
+from api.utils import SparseFields
+from recipes.models import IngredientRecipe, Recipe
+
+# Full scans of these tables grow with the catalogue.
+TABLES = ('recipes_recipe', 'recipes_ingredientrecipe')
+SEQ_SCAN = re.compile(r'Seq Scan on (\w+)')
+# 'Index Scan using <name>', 'Bitmap Index Scan on <name>' and the like.
+INDEX_SCAN = re.compile(r'Index (?:Only )?Scan (?:Backward )?(?:using|on) '
+                        r'(\w+)')
+
+
+class Command(BaseCommand):
+    help = ('Show query plans of the recipe list with cooking time and '
+            'ingredient filters, fail on sequential scans')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Ingredient filters need PostgreSQL arrays.')
+        ingredients = ','.join(map(str, IngredientRecipe.objects.values_list(
+            'ingredient_id', flat=True).distinct()[:3])) or '1'
+        cases = {
+            'cooking_time': {'cooking_time_min': 10,
+                             'cooking_time_max': 20},
+            'max_ingredients': {'max_ingredients': 3},
+            'exclude_ingredients': {'exclude_ingredients': ingredients},
+            'with_ingredients': {'with_ingredients': ingredients},
+            'combined': {'cooking_time_max': 15, 'max_ingredients': 5,
+                         'exclude_ingredients': ingredients},
+        }
+        results, failed = {}, []
+        for name, params in cases.items():
+            queryset = RecipeFilter(
+                params, queryset=Recipe.objects.all()).qs
+            plan = self.explain(recipe_rows(
+                queryset, AnonymousUser(), SparseFields())[:10])
+            scans = sorted({table for table in SEQ_SCAN.findall(plan)
+                            if table in TABLES})
+            if scans:
+                failed.append(name)
+            results[name] = {
+                'full_scans': scans,
+                'indexes': sorted(set(INDEX_SCAN.findall(plan))),
+                'plan': plan.splitlines()}
+        self.stdout.write(json.dumps(results, indent=2))
+        if failed:
+            raise CommandError(f'Full table scans: {", ".join(failed)}')
+
+    @staticmethod
+    def explain(queryset):
+        """Plan with sequential scans discouraged.
+
+        On a small table PostgreSQL prefers a sequential scan even when
+        an index fits, disabling them shows whether an index can serve
+        the query at all.
+        """
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            return queryset.explain()
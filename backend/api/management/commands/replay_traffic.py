@@ -0,0 +1,245 @@
+import asyncio
+import json
+import re
+import time
+import zlib
+from bisect import bisect_left
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+from .benchmark_api import percentile
+
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+ID_SEGMENT = re.compile(r'/(users|recipes|tags|ingredients)/(\d+)(?=/|$)')
+QUERY_ID = re.compile(r'([?&]author=)(\d+)')
+
+
+def stable_index(value, size):
+    """Map a captured identifier onto one of `size` seeded objects."""
+    return zlib.crc32(str(value).encode()) % size
+
+
+class Rewriter:
+    """Replace captured IDs and credentials with ones from this database."""
+
+    def __init__(self):
+        # Ordered, so the same capture maps onto the same objects on
+        # every run and database.
+        self.ids = {
+            kind: list(model.objects.order_by('id').values_list(
+                'id', flat=True))
+            for kind, model in (('users', User), ('recipes', Recipe),
+                                ('tags', Tag), ('ingredients', Ingredient))
+        }
+        if not all(self.ids.values()):
+            raise CommandError(
+                'The database is empty, run generate_sample_data first.')
+        self.tokens = {}
+
+    def map_id(self, kind, value):
+        ids = self.ids[kind]
+        return ids[stable_index(value, len(ids))]
+
+    def token(self, captured_user):
+        if captured_user not in self.tokens:
+            user_id = self.map_id('users', captured_user)
+            token, _ = Token.objects.get_or_create(user_id=user_id)
+            self.tokens[captured_user] = token.key
+        return self.tokens[captured_user]
+
+    def path(self, path):
+        path = ID_SEGMENT.sub(
+            lambda match: (f'/{match[1]}/'
+                           f'{self.map_id(match[1], match[2])}'), path)
+        return QUERY_ID.sub(
+            lambda match: f'{match[1]}{self.map_id("users", match[2])}',
+            path)
+
+    def body(self, body):
+        if not isinstance(body, dict):
+            return body
+        body = dict(body)
+        if isinstance(body.get('tags'), list):
+            body['tags'] = [self.map_id('tags', tag) for tag in body['tags']]
+        if isinstance(body.get('ingredients'), list):
+            body['ingredients'] = [
+                {**item, 'id': self.map_id('ingredients', item.get('id'))}
+                for item in body['ingredients'] if isinstance(item, dict)]
+        return body
+
+    def rewrite(self, record):
+        """Return (method, path, body, token) or None for foreign lines."""
+        method, path = record.get('method'), record.get('path')
+        if not isinstance(method, str) or not isinstance(path, str):
+            return None
+        user = record.get('user', record.get('token'))
+        return (method.upper(), self.path(path),
+                self.body(record.get('body')),
+                self.token(user) if user is not None else None)
+
+
+class Stats:
+
+    def __init__(self):
+        self.endpoints = {}
+
+    @staticmethod
+    def endpoint(method, path):
+        path = ID_SEGMENT.sub(r'/\1/{id}', urlsplit(path).path)
+        return f'{method} {path}'
+
+    def record(self, method, path, status, elapsed):
+        stats = self.endpoints.setdefault(self.endpoint(method, path), {
+            'latencies': [], 'status_codes': {}, 'errors': 0})
+        stats['latencies'].append(elapsed * 1000)
+        stats['status_codes'][status] = stats['status_codes'].get(
+            status, 0) + 1
+        if status is None or status >= 500:
+            stats['errors'] += 1
+
+    def report(self):
+        report = {}
+        for endpoint, stats in sorted(self.endpoints.items()):
+            latencies = stats['latencies']
+            histogram = [0] * (len(BUCKETS_MS) + 1)
+            for value in latencies:
+                histogram[bisect_left(BUCKETS_MS, value)] += 1
+            report[endpoint] = {
+                'requests': len(latencies),
+                'error_rate': round(stats['errors'] / len(latencies), 4),
+                'status_codes': {str(code): count for code, count
+                                 in stats['status_codes'].items()},
+                'latency_ms': {
+                    'p50': round(percentile(latencies, 50), 3),
+                    'p90': round(percentile(latencies, 90), 3),
+                    'p99': round(percentile(latencies, 99), 3),
+                    'max': round(max(latencies), 3),
+                },
+                'histogram_ms': {
+                    **{f'le_{bound}': count for bound, count
+                       in zip(BUCKETS_MS, histogram)},
+                    'le_inf': histogram[-1],
+                },
+            }
+        return report
+
+
+async def send_http(target, method, path, body, token):
+    """Send one HTTP/1.1 request with asyncio streams, return the status."""
+    url = urlsplit(target)
+    port = url.port or (443 if url.scheme == 'https' else 80)
+    reader, writer = await asyncio.open_connection(
+        url.hostname, port, ssl=url.scheme == 'https' or None)
+    payload = json.dumps(body).encode() if body is not None else b''
+    headers = [f'{method} {path} HTTP/1.1', f'Host: {url.netloc}',
+               'Connection: close', 'Accept: application/json',
+               f'Content-Length: {len(payload)}']
+    if body is not None:
+        headers.append('Content-Type: application/json')
+    if token:
+        headers.append(f'Authorization: Token {token}')
+    writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode() + payload)
+    await writer.drain()
+    status_line = await reader.readline()
+    await reader.read()
+    writer.close()
+    return int(status_line.split()[1])
+
+
+def send_test_client(method, path, body, token):
+    headers = {'Authorization': f'Token {token}'} if token else {}
+    client = Client(raise_request_exception=False, headers=headers)
+    return getattr(client, method.lower())(
+        path, body, content_type='application/json').status_code
+
+
+class Command(BaseCommand):
+    help = 'Replay captured API calls from a JSONL file as a load test'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file', default=settings.BASE_DIR.parent / 'requests.jsonl')
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--limit', type=int,
+                            help='Replay at most this many calls.')
+        parser.add_argument(
+            '--target',
+            help='Base URL of a running server, e.g. http://localhost:8000. '
+                 'Without it calls go through the Django test client.')
+        parser.add_argument('--output', help='Write JSON to this file.')
+
+    def handle(self, *args, **options):
+        rewriter = Rewriter()
+        stats = Stats()
+        with override_settings(ALLOWED_HOSTS=['*']):
+            started = time.perf_counter()
+            replayed, skipped = asyncio.run(
+                self.replay(rewriter, stats, options))
+            duration = time.perf_counter() - started
+
+        report = {
+            'mode': options['target'] or 'test-client',
+            'concurrency': options['concurrency'],
+            'replayed': replayed,
+            'skipped': skipped,
+            'duration_seconds': round(duration, 3),
+            'throughput_rps': round(replayed / duration, 2),
+            'endpoints': stats.report(),
+        }
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+    async def replay(self, rewriter, stats, options):
+        queue = asyncio.Queue(maxsize=options['concurrency'] * 2)
+        counters = {'queued': 0, 'replayed': 0, 'skipped': 0}
+
+        async def worker():
+            while (call := await queue.get()) is not None:
+                method, path, body, token = call
+                start = time.perf_counter()
+                try:
+                    if options['target']:
+                        status = await send_http(
+                            options['target'], method, path, body, token)
+                    else:
+                        status = await asyncio.to_thread(
+                            send_test_client, method, path, body, token)
+                except (OSError, ValueError, IndexError,
+                        asyncio.IncompleteReadError):
+                    status = None
+                stats.record(method, path, status,
+                             time.perf_counter() - start)
+                counters['replayed'] += 1
+
+        workers = [asyncio.create_task(worker())
+                   for _ in range(options['concurrency'])]
+        with open(options['file'], encoding='utf-8') as file:
+            for line in file:
+                if counters['queued'] == options['limit']:
+                    break
+                try:
+                    call = await asyncio.to_thread(
+                        rewriter.rewrite, json.loads(line))
+                except (ValueError, AttributeError):
+                    call = None
+                if call is None:
+                    counters['skipped'] += 1
+                    continue
+                await queue.put(call)
+                counters['queued'] += 1
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+        return counters['replayed'], counters['skipped']
@@ -0,0 +1,33 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from api.recipe_details import warm
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Prerender details of the recipes favorited most often'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top', type=int,
+            default=settings.RECIPE_DETAIL_CACHE['WARM_TOP'])
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        recipe_ids = list(Recipe.objects.annotate(
+            favorites=Count('favorite_recipe')).order_by(
+            '-favorites', '-id').values_list('id', flat=True)[
+            :options['top']])
+        warm(recipe_ids)
+        elapsed = time.monotonic() - started
+        self.stdout.write(json.dumps({
+            'recipes': len(recipe_ids),
+            'seconds': round(elapsed, 3),
+            'recipes_per_second': round(
+                len(recipe_ids) / max(elapsed, 0.001), 1),
+        }, indent=2))
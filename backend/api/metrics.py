@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import Counter, defaultdict
+
+METRICS = (
+    ('requests_total', 'counter', 'Number of handled requests.'),
+    ('request_duration_seconds_sum', 'counter',
+     'Total time spent handling requests.'),
+    ('db_queries_total', 'counter', 'Number of executed SQL queries.'),
+    ('db_duplicate_queries_total', 'counter',
+     'Number of SQL queries repeating an earlier query of the request.'),
+    ('db_duration_seconds_sum', 'counter', 'Total time spent in SQL.'),
+    ('render_duration_seconds_sum', 'counter',
+     'Total time spent rendering responses.'),
+)
+
+
+class QueryCollector:
+    """Database execute wrapper counting queries of a single request.
+
+    Queries are compared by their SQL with placeholders, so the same
+    statement run with different parameters (the N+1 signature) counts
+    as a duplicate.
+    """
+
+    def __init__(self):
+        self.statements = Counter()
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.statements[sql] += 1
+
+    @property
+    def count(self):
+        return sum(self.statements.values())
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.statements.values())
+
+
+class MetricsRegistry:
+    """Per-process counters of request metrics grouped by view name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = defaultdict(lambda: dict.fromkeys(
+            (name for name, _, _ in METRICS), 0))
+
+    def record(self, view_name, duration, collector, render_duration):
+        with self._lock:
+            values = self._values[view_name]
+            values['requests_total'] += 1
+            values['request_duration_seconds_sum'] += duration
+            values['db_queries_total'] += collector.count
+            values['db_duplicate_queries_total'] += collector.duplicates
+            values['db_duration_seconds_sum'] += collector.duration
+            values['render_duration_seconds_sum'] += render_duration
+
+    def render(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        with self._lock:
+            snapshot = {view: dict(values)
+                        for view, values in self._values.items()}
+        lines = []
+        for name, metric_type, description in METRICS:
+            lines.append(f'# HELP foodgram_{name} {description}')
+            lines.append(f'# TYPE foodgram_{name} {metric_type}')
+            for view_name, values in sorted(snapshot.items()):
+                lines.append(
+                    f'foodgram_{name}{{view="{view_name}"}} {values[name]}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,160 @@
+import gzip
+import hashlib
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+from rest_framework.permissions import SAFE_METHODS
+
+from foodgram.db_routers import reset_read_from_replica, set_read_from_replica
+
+from .metrics import QueryCollector, registry
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class ReplicaRoutingMiddleware:
+    """Route reads of safe requests to replicas.
+
+    After a successful write the client is pinned to the primary for
+    DATABASE_REPLICA_PIN_SECONDS, so it reads its own writes.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    @staticmethod
+    def get_pin_key(request):
+        client = (request.META.get('HTTP_AUTHORIZATION')
+                  or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+                  or request.META.get('REMOTE_ADDR', ''))
+        digest = hashlib.sha256(client.encode()).hexdigest()
+        return f'db-pin:{digest}'
+
+    def __call__(self, request):
+        pin_key = self.get_pin_key(request)
+        is_safe = request.method in SAFE_METHODS
+        token = set_read_from_replica(is_safe and not cache.get(pin_key))
+        try:
+            response = self.get_response(request)
+        finally:
+            reset_read_from_replica(token)
+        if not is_safe and response.status_code < 400:
+            cache.set(pin_key, True, settings.DATABASE_REPLICA_PIN_SECONDS)
+        return response
+
+
+class QueryMetricsMiddleware:
+    """Measure SQL queries and render time of every request.
+
+    The numbers are sent back in the Server-Timing header and collected
+    for the metrics endpoint. Enabled by QUERY_METRICS_ENABLED.
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        collector = QueryCollector()
+        request._render_duration = 0.0
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(collector))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unresolved'
+        registry.record(view_name, duration, collector,
+                        request._render_duration)
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={collector.duration * 1000:.1f};'
+            f'desc="{collector.count} queries, '
+            f'{collector.duplicates} duplicates"',
+            f'render;dur={request._render_duration * 1000:.1f}',
+            f'total;dur={duration * 1000:.1f}',
+        ))
+        return response
+
+    def process_template_response(self, request, response):
+        start = time.perf_counter()
+
+        def finish_render(rendered):
+            request._render_duration = time.perf_counter() - start
+
+        response.add_post_render_callback(finish_render)
+        return response
+
+
+class CompressionMiddleware:
+    """Compress API responses with brotli, when installed, or gzip.
+
+    Only COMPRESSION['CONTENT_TYPES'] of at least MIN_SIZE bytes are
+    compressed, HTML pages with CSRF tokens are left alone.
+    """
+
+    def __init__(self, get_response):
+        if not settings.COMPRESSION['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.options = settings.COMPRESSION
+
+    @staticmethod
+    def get_accepted_encodings(request):
+        encodings = set()
+        header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        for item in header.replace(' ', '').lower().split(','):
+            name, _, quality = item.partition(';q=')
+            try:
+                if float(quality or 1) > 0:
+                    encodings.add(name)
+            except ValueError:
+                continue
+        return encodings
+
+    def compress(self, content, encoding):
+        if encoding == 'br':
+            return brotli.compress(
+                content, quality=self.options['BROTLI_QUALITY'])
+        return gzip.compress(
+            content, compresslevel=self.options['GZIP_LEVEL'], mtime=0)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        content_type = response.get('Content-Type', '').split(';')[0]
+        if (response.streaming
+                or content_type not in self.options['CONTENT_TYPES']
+                or response.has_header('Content-Encoding')):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < self.options['MIN_SIZE']:
+            return response
+        accepted = self.get_accepted_encodings(request)
+        if brotli is not None and 'br' in accepted:
+            encoding = 'br'
+        elif 'gzip' in accepted:
+            encoding = 'gzip'
+        else:
+            return response
+        compressed = self.compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,109 @@
+"""Cached public profiles of users and sets of followed authors.
+
+Two levels: a memo living for one request and a Django cache shared
+by workers. Profiles are kept as tuples of USER_FIELDS, followed
+author ids as packed 64-bit integers. Entries are dropped when a user
+or a subscription changes, TTL bounds what a missed invalidation can
+leave behind. Misses are loaded from the primary: a lagging replica
+would put the old values back for TTL seconds.
+"""
+from array import array
+
+from asgiref.local import Local
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import request_finished, request_started
+from django.db import transaction
+from django.dispatch import receiver
+
+from foodgram.db_routers import reset_read_from_replica, set_read_from_replica
+from users.models import Subscribe, User
+
+USER_FIELDS = ('email', 'id', 'username', 'first_name', 'last_name')
+PROFILE_KEY = 'profile:{}'
+FOLLOWING_KEY = 'following:{}'
+
+_memo = Local()
+
+
+@receiver(request_started)
+def start_memo(**kwargs):
+    _memo.profiles = {}
+    _memo.following = {}
+
+
+@receiver(request_finished)
+def clear_memo(**kwargs):
+    _memo.profiles = _memo.following = None
+
+
+def get_memo(name):
+    """The memo of the current request, outside requests a throwaway."""
+    memo = getattr(_memo, name, None)
+    return {} if memo is None else memo
+
+
+def get_cache():
+    return caches[settings.PROFILE_CACHE['CACHE']]
+
+
+def get_profiles(user_ids):
+    """{user id: profile dict} of the existing users among user_ids."""
+    memo = get_memo('profiles')
+    missing = {user_id for user_id in user_ids if user_id not in memo}
+    if missing:
+        cache = get_cache()
+        found = cache.get_many([PROFILE_KEY.format(user_id)
+                                for user_id in missing])
+        rows = {values[1]: values for values in found.values()}
+        token = set_read_from_replica(False)
+        try:
+            loaded = {
+                values[1]: values for values in User.objects.filter(
+                    id__in=missing - rows.keys()).values_list(*USER_FIELDS)}
+        finally:
+            reset_read_from_replica(token)
+        if loaded:
+            cache.set_many({PROFILE_KEY.format(user_id): values
+                            for user_id, values in loaded.items()},
+                           settings.PROFILE_CACHE['TTL'])
+        rows.update(loaded)
+        memo.update(rows)
+    return {user_id: dict(zip(USER_FIELDS, memo[user_id]))
+            for user_id in user_ids if user_id in memo}
+
+
+def get_following(user):
+    """Ids of the authors the user is subscribed to."""
+    if not user.is_authenticated:
+        return frozenset()
+    memo = get_memo('following')
+    if user.id not in memo:
+        cache = get_cache()
+        key = FOLLOWING_KEY.format(user.id)
+        packed = cache.get(key)
+        if packed is None:
+            token = set_read_from_replica(False)
+            try:
+                packed = array('q', sorted(Subscribe.objects.filter(
+                    user_id=user.id).values_list('author_id', flat=True)))
+            finally:
+                reset_read_from_replica(token)
+            cache.set(key, packed.tobytes(), settings.PROFILE_CACHE['TTL'])
+        else:
+            packed = array('q', packed)
+        memo[user.id] = frozenset(packed)
+    return memo[user.id]
+
+
+def forget_profile(user_id):
+    """Drop the profile, from the shared cache once the change commits."""
+    get_memo('profiles').pop(user_id, None)
+    key = PROFILE_KEY.format(user_id)
+    transaction.on_commit(lambda: get_cache().delete(key))
+
+
+def forget_following(user_id):
+    get_memo('following').pop(user_id, None)
+    key = FOLLOWING_KEY.format(user_id)
+    transaction.on_commit(lambda: get_cache().delete(key))
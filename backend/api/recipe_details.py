@@ -0,0 +1,132 @@
+"""Prerendered recipe details shared by all viewers.
+
+The cache keeps the full payload built for an anonymous viewer, a
+request adds its own flags and applies ?fields= and ?expand=. Entries
+are fresh for TTL seconds and served stale for STALE_SECONDS more:
+whoever takes the lock renders the recipe again, concurrent requests
+keep getting the stale payload instead of piling on the database.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from foodgram.db_routers import reset_read_from_replica, set_read_from_replica
+from recipes.models import Favorite, Recipe, ShoppingList
+
+from .fast_serializers import recipes_by_ids
+from .profiles import get_following
+from .serializers import RecipeListSerializer
+from .utils import SparseFields
+
+DETAIL_KEY = 'recipe-detail:{}'
+LOCK_KEY = 'recipe-detail-lock:{}'
+FLAGS = (('is_favorited', Favorite), ('is_in_shopping_cart', ShoppingList))
+
+
+def get_cache():
+    return caches[settings.RECIPE_DETAIL_CACHE['CACHE']]
+
+
+def render(recipe_ids):
+    """{recipe id: payload or None} with every field expanded.
+
+    Reads go to the primary: a replica lagging behind the change that
+    dropped the payload would put the old recipe back for TTL seconds.
+    """
+    payloads = dict.fromkeys(recipe_ids)
+    token = set_read_from_replica(False)
+    try:
+        for item in recipes_by_ids(
+                recipe_ids, AnonymousUser(), SparseFields()):
+            payloads[item['id']] = item
+    finally:
+        reset_read_from_replica(token)
+    return payloads
+
+
+def store(payloads):
+    options = settings.RECIPE_DETAIL_CACHE
+    fresh_until = time.time() + options['TTL']
+    get_cache().set_many(
+        {DETAIL_KEY.format(recipe_id): (fresh_until, payload)
+         for recipe_id, payload in payloads.items()},
+        options['TTL'] + options['STALE_SECONDS'])
+
+
+def get_payload(recipe_id):
+    """Payload of the recipe for an anonymous viewer, None if missing."""
+    options = settings.RECIPE_DETAIL_CACHE
+    cache = get_cache()
+    key = DETAIL_KEY.format(recipe_id)
+    entry = cache.get(key)
+    if entry is not None and entry[0] > time.time():
+        return entry[1]
+    lock = LOCK_KEY.format(recipe_id)
+    if cache.add(lock, 1, options['LOCK_SECONDS']):
+        try:
+            payloads = render([recipe_id])
+            store(payloads)
+        finally:
+            cache.delete(lock)
+        return payloads[recipe_id]
+    if entry is not None:
+        return entry[1]
+    # Nothing to serve yet, give the lock holder a moment.
+    deadline = time.monotonic() + options['WAIT_MS'] / 1000
+    while time.monotonic() < deadline:
+        time.sleep(0.01)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[1]
+    return render([recipe_id])[recipe_id]
+
+
+def get_flags(recipe_id, user, sparse):
+    names = [(name, model) for name, model in FLAGS if sparse.wants(name)]
+    flags = dict.fromkeys((name for name, _ in names), False)
+    if names and user.is_authenticated:
+        flags.update(Recipe.objects.filter(pk=recipe_id).values(**{
+            name: Exists(model.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+            for name, model in names}).first() or {})
+    return flags
+
+
+def get_detail(recipe_id, user, sparse):
+    """Recipe as RecipeListSerializer renders it for the user, or None."""
+    payload = get_payload(recipe_id)
+    if payload is None:
+        return None
+    flags = get_flags(recipe_id, user, sparse)
+    data = {}
+    for name in RecipeListSerializer.Meta.fields:
+        if not sparse.wants(name):
+            continue
+        value = payload[name]
+        if name in flags:
+            value = flags[name]
+        elif name == 'author':
+            value = (dict(value, is_subscribed=value['id'] in get_following(
+                user)) if sparse.expands(name) else value['id'])
+        elif name in ('tags', 'ingredients') and not sparse.expands(name):
+            value = [item['id'] for item in value]
+        data[name] = value
+    return data
+
+
+def warm(recipe_ids):
+    """Prerender the recipes, BATCH_SIZE at a time."""
+    batch_size = settings.RECIPE_DETAIL_CACHE['BATCH_SIZE']
+    for start in range(0, len(recipe_ids), batch_size):
+        store(render(recipe_ids[start:start + batch_size]))
+
+
+def forget(recipe_ids):
+    """Drop payloads once the transaction of the change is committed."""
+    keys = [DETAIL_KEY.format(recipe_id) for recipe_id in recipe_ids]
+    if keys:
+        transaction.on_commit(lambda: get_cache().delete_many(keys))
@@ -0,0 +1,45 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class PrometheusRenderer(BaseRenderer):
+    """Plain text renderer for the Prometheus exposition format."""
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            return '\n'.join(f'# {key}: {value}'
+                             for key, value in data.items())
+        return data
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer producing the same bytes with orjson.
+
+    Pretty printed and ASCII output, values orjson cannot encode and
+    missing orjson fall back to the standard encoder. orjson writes
+    floats differently, use the renderer for views without them.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii
+                or not self.compact
+                or self.get_indent(accepted_media_type,
+                                   renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default,
+                               option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        # Same escaping of U+2028 and U+2029 as JSONRenderer.
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+            b'\xe2\x80\xa9', b'\\u2029')
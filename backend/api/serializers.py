@@ -1,14 +1,23 @@
 import base64
+from datetime import datetime, timezone
 
+from django.conf import settings
 from django.core.files.base import ContentFile
 from django.core.validators import RegexValidator
 from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from rest_framework import serializers
+from rest_framework import exceptions, serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.tokens import RefreshToken
 
-from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingList, Tag)
-from users.models import Subscribe, User
+from events.outbox import emit
+from recipes.models import (ExclusionProfile, Favorite, Ingredient,
+                            IngredientRecipe, Recipe, ShoppingList, Tag)
+from recipes.tasks import optimize_recipe_image
+from users.models import DeniedToken, User
+
+from .profiles import get_following
+from .utils import SparseFields, insert_ignore
 
 
 class Base64ImageField(serializers.ImageField):
@@ -32,7 +41,74 @@ class SetPasswordSerializer(serializers.Serializer):
         return value
 
 
-class CustomUserSerializer(UserSerializer):
+def deny_refresh_token(token):
+    """Put a refresh token on the denylist, False if it already was."""
+    expires_at = datetime.fromtimestamp(token['exp'], tz=timezone.utc)
+    return bool(insert_ignore(
+        DeniedToken, [{'jti': token['jti'], 'expires_at': expires_at}]))
+
+
+class JWTObtainPairSerializer(TokenObtainPairSerializer):
+    """Issue JWT pair carrying the claims needed for stateless auth."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['is_staff'] = user.is_staff
+        return token
+
+
+class JWTRefreshSerializer(serializers.Serializer):
+    """Rotate a refresh token, a token can be used only once."""
+    refresh = serializers.CharField(write_only=True)
+
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs['refresh'])
+        if not deny_refresh_token(refresh):
+            raise exceptions.AuthenticationFailed(
+                'Refresh token has already been used.')
+        user = User.objects.filter(
+            id=refresh['user_id'], is_active=True).first()
+        if user is None:
+            raise exceptions.AuthenticationFailed('User is inactive.')
+        new_refresh = JWTObtainPairSerializer.get_token(user)
+        return {'refresh': str(new_refresh),
+                'access': str(new_refresh.access_token)}
+
+
+class JWTLogoutSerializer(serializers.Serializer):
+    refresh = serializers.CharField(write_only=True)
+
+    def validate(self, attrs):
+        deny_refresh_token(RefreshToken(attrs['refresh']))
+        return {}
+
+
+class SparseFieldsMixin:
+    """Apply ?fields= and ?expand= of the request to a top level serializer.
+
+    Nested fields left out of ?expand= are replaced with the fields
+    from get_collapsed_fields(), which return IDs only.
+    """
+
+    def get_collapsed_fields(self):
+        return {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if parent is not None:
+            return fields
+        sparse = SparseFields(self.context.get('request'))
+        collapsed = self.get_collapsed_fields()
+        return {name: (collapsed[name] if name in collapsed
+                       and not sparse.expands(name) else field)
+                for name, field in fields.items() if sparse.wants(name)}
+
+
+class CustomUserSerializer(SparseFieldsMixin, UserSerializer):
     """Serializer for custom users."""
     is_subscribed = serializers.SerializerMethodField()
 
@@ -44,10 +120,7 @@ class CustomUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Subscribe.objects.filter(user=user, author=obj.id).exists()
+        return obj.id in get_following(self.context.get('request').user)
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -94,6 +167,48 @@ class RecipeSubSerializer(serializers.ModelSerializer):
         return obj.image.url
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    """Serializer for batch operations on lists of recipes."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BATCH_MAX_SIZE)
+
+
+class MealPlanSerializer(serializers.Serializer):
+    """Parameters of a meal plan, one meal of every tag a day."""
+    tags = serializers.SlugRelatedField(
+        slug_field='slug', queryset=Tag.objects.all(), many=True,
+        allow_empty=False)
+    days = serializers.IntegerField(
+        min_value=1, max_value=settings.MEAL_PLAN['MAX_DAYS'])
+    max_cooking_time = serializers.IntegerField(min_value=1, required=False)
+    add_to_shopping_cart = serializers.BooleanField(default=False)
+
+    def validate_tags(self, value):
+        return list(dict.fromkeys(tag.slug for tag in value))
+
+
+class ExclusionProfileSerializer(serializers.ModelSerializer):
+    """Serializer for ingredients excluded from the recipe list."""
+    ingredients = serializers.PrimaryKeyRelatedField(
+        queryset=Ingredient.objects.all(), many=True)
+
+    class Meta:
+        model = ExclusionProfile
+        fields = ('id', 'name', 'ingredients')
+
+    def validate_name(self, value):
+        profiles = ExclusionProfile.objects.filter(
+            user=self.context['request'].user, name=value)
+        if self.instance is not None:
+            profiles = profiles.exclude(pk=self.instance.pk)
+        if profiles.exists():
+            raise serializers.ValidationError(
+                'Exclusion profile with this name already exists.')
+        return value
+
+
 class SubscribeSerializer(CustomUserSerializer):
     """Serializer for Subscribtion."""
     recipes = serializers.SerializerMethodField()
@@ -112,16 +227,16 @@ class SubscribeSerializer(CustomUserSerializer):
         if user == author:
             raise serializers.ValidationError(
                 'You literally cant subscribe urself.')
-        if Subscribe.objects.filter(
-                user=user, author=author).exists():
-            raise serializers.ValidationError(
-                f'You already subscribed on {author}.')
         return data
 
     def get_recipes_count(self, obj):
         return Recipe.objects.filter(author_id=obj.id).count()
 
-    def get_recipes(self, obj):
+    def get_collapsed_fields(self):
+        return {'recipes': serializers.SerializerMethodField(
+            method_name='get_recipe_ids')}
+
+    def get_recipes_queryset(self, obj):
         recipes_limit = (self.context.get('request').
                          query_params.get('recipes_limit'))
         try:
@@ -135,11 +250,18 @@ class SubscribeSerializer(CustomUserSerializer):
 
         if recipes_limit is not None:
             recipes_queryset = recipes_queryset[:recipes_limit]
+        return recipes_queryset
 
-        recipes_serializer = RecipeSubSerializer(recipes_queryset, many=True)
+    def get_recipes(self, obj):
+        recipes_serializer = RecipeSubSerializer(
+            self.get_recipes_queryset(obj), many=True)
 
         return recipes_serializer.data
 
+    def get_recipe_ids(self, obj):
+        return list(self.get_recipes_queryset(obj).values_list(
+            'id', flat=True))
+
 
 class IngredientSerializer(serializers.ModelSerializer):
     """Serializer for ingredients."""
@@ -168,7 +290,7 @@ class IngredientRecipeSerializers(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeListSerializer(serializers.ModelSerializer):
+class RecipeListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer to display recipes."""
     tags = TagSerializer(many=True, read_only=True)
     author = CustomUserSerializer(read_only=True)
@@ -186,6 +308,16 @@ class RecipeListSerializer(serializers.ModelSerializer):
                   'is_favorited', 'is_in_shopping_cart',
                   'name', 'image', 'text', 'cooking_time')
 
+    def get_collapsed_fields(self):
+        return {
+            'tags': serializers.PrimaryKeyRelatedField(
+                many=True, read_only=True),
+            'author': serializers.PrimaryKeyRelatedField(read_only=True),
+            'ingredients': serializers.SlugRelatedField(
+                source='recipe_ingredients', slug_field='ingredient_id',
+                many=True, read_only=True),
+        }
+
     def get_image(self, obj):
         return obj.image.url
 
@@ -245,6 +377,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         if cooking_time < 1:
             raise serializers.ValidationError(
                 'Cooking time should be at least one minute')
+        return cooking_time
 
     def validate_tags(self, data):
         tags = self.initial_data.get('tags')
@@ -285,6 +418,16 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                 amount=amount)
             ingredients.append(ingredient_obj)
         IngredientRecipe.objects.bulk_create(ingredients)
+        recipe.ingredients_count = len(ingredients)
+        recipe.ingredient_ids = sorted(
+            item.ingredient_id for item in ingredients)
+        Recipe.objects.filter(pk=recipe.pk).update(
+            ingredients_count=recipe.ingredients_count,
+            ingredient_ids=recipe.ingredient_ids)
+        # bulk_create() sends no post_save.
+        emit(IngredientRecipe, 'created', [
+            {'recipe_id': recipe.id, 'ingredient_id': item.ingredient_id}
+            for item in ingredients])
 
     @transaction.atomic
     def create(self, validated_data):
@@ -295,6 +438,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(author=author, **validated_data)
         recipe.tags.set(tags_data)
         self.create_ingredients(recipe, ingredients_data)
+        optimize_recipe_image.delay(recipe_id=recipe.id)
         return recipe
 
     @transaction.atomic
@@ -0,0 +1,61 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.models import IngredientRecipe, Recipe
+from recipes.signals import recipes_touched
+from users.models import Subscribe, User
+
+from .authentication import get_token_cache
+from .profiles import USER_FIELDS, forget_following, forget_profile
+from .recipe_details import forget
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    get_token_cache().delete_many([instance.key])
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(sender, instance, created, **kwargs):
+    if not created:
+        get_token_cache().delete_many(
+            Token.objects.filter(user=instance).values_list('key', flat=True))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user_profile(sender, instance, update_fields=None, **kwargs):
+    # Logins save only last_login.
+    if update_fields is None or set(USER_FIELDS) & set(update_fields):
+        forget_profile(instance.pk)
+
+
+@receiver(post_save, sender=Subscribe)
+@receiver(post_delete, sender=Subscribe)
+def forget_user_following(sender, instance, **kwargs):
+    forget_following(instance.user_id)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def forget_recipe_detail(sender, instance, **kwargs):
+    forget([instance.pk])
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def forget_ingredients_detail(sender, instance, **kwargs):
+    forget([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def forget_tags_detail(sender, instance, action, reverse, pk_set, **kwargs):
+    if action.startswith('post_'):
+        forget((pk_set or ()) if reverse else [instance.pk])
+
+
+@receiver(recipes_touched)
+def forget_touched_details(sender, queryset, **kwargs):
+    # Read the ids now, rows may be gone when the change is committed.
+    forget(list(queryset.values_list('id', flat=True)))
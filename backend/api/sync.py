@@ -0,0 +1,143 @@
+import base64
+import binascii
+import hashlib
+import json
+from datetime import datetime
+
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingList, Tag,
+                            Tombstone)
+from users.models import Subscribe
+
+from .fast_serializers import recipes_by_ids
+from .serializers import IngredientSerializer, TagSerializer
+
+STREAMS = {'recipes': Recipe, 'tags': Tag, 'ingredients': Ingredient}
+# Favorites, the cart and subscriptions change without touching recipes,
+# they are synced as lists of ids instead of flags inside recipes.
+LISTS = {'favorites': (Favorite, 'recipe_id'),
+         'shopping_cart': (ShoppingList, 'recipe_id'),
+         'subscriptions': (Subscribe, 'author_id')}
+USER_FLAGS = ('is_favorited', 'is_in_shopping_cart')
+
+
+def encode_cursor(positions):
+    """Pack positions into an opaque URL safe string.
+
+    Streams map to [timestamp, id], synced_at to a timestamp and lists
+    to the version of the synced lists.
+    """
+    data = {}
+    for key, value in positions.items():
+        if isinstance(value, (list, tuple)):
+            data[key] = [value[0].isoformat(), value[1]]
+        elif isinstance(value, str):
+            data[key] = value
+        else:
+            data[key] = value.isoformat()
+    return base64.urlsafe_b64encode(
+        json.dumps(data, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        positions = {}
+        for key, value in data.items():
+            if isinstance(value, list):
+                positions[key] = (datetime.fromisoformat(value[0]),
+                                  int(value[1]))
+            elif key == 'lists':
+                positions[key] = str(value)
+            else:
+                positions[key] = datetime.fromisoformat(value)
+        return positions
+    except (ValueError, TypeError, IndexError, AttributeError,
+            binascii.Error):
+        raise ValidationError({'cursor': 'Invalid cursor.'})
+
+
+def keyset_page(queryset, field, position, until, limit, *fields):
+    """(id, timestamp, *fields) of rows changed after position, up to until.
+
+    Rows are ordered by (timestamp, id), one extra row tells whether
+    there are more.
+    """
+    if position is not None:
+        timestamp, pk = position
+        queryset = queryset.filter(
+            Q(**{f'{field}__gt': timestamp})
+            | Q(**{field: timestamp, 'id__gt': pk}))
+    return list(queryset.filter(**{f'{field}__lte': until}).order_by(
+        field, 'id').values_list('id', field, *fields)[:limit + 1])
+
+
+def serialize_stream(stream, ids, request, sparse):
+    """Serialize objects of a stream in the order of ids."""
+    if stream == 'recipes':
+        data = recipes_by_ids(ids, AnonymousUser(), sparse)
+        for item in data:
+            for name in USER_FLAGS:
+                item.pop(name, None)
+            if isinstance(item.get('author'), dict):
+                item['author'].pop('is_subscribed', None)
+        return data
+    order = {pk: index for index, pk in enumerate(ids)}
+    serializer = TagSerializer if stream == 'tags' else IngredientSerializer
+    objects = sorted(STREAMS[stream].objects.filter(id__in=ids),
+                     key=lambda obj: order[obj.id])
+    return serializer(objects, many=True).data
+
+
+def get_lists(user):
+    """Sorted ids in the favorites, cart and subscriptions of the user."""
+    return {name: sorted(model.objects.filter(user=user).values_list(
+        column, flat=True)) for name, (model, column) in LISTS.items()}
+
+
+def get_lists_version(lists):
+    return hashlib.sha256(json.dumps(
+        lists, separators=(',', ':')).encode()).hexdigest()[:16]
+
+
+def get_changes(positions, until, limit, request, sparse):
+    """Changed and deleted objects of every stream after positions.
+
+    Returns (response data without the cursor, new positions).
+    """
+    data = {stream: {'updated': [], 'deleted': []} for stream in STREAMS}
+    has_more = False
+    for stream, model in STREAMS.items():
+        rows = keyset_page(model.objects.all(), 'updated_at',
+                           positions.get(stream), until, limit)
+        if len(rows) > limit:
+            has_more = True
+            rows = rows[:limit]
+        if rows:
+            positions[stream] = (rows[-1][1], rows[-1][0])
+            data[stream]['updated'] = serialize_stream(
+                stream, [pk for pk, _ in rows], request, sparse)
+
+    tombstones = keyset_page(
+        Tombstone.objects.all(), 'deleted_at', positions.get('deleted'),
+        until, limit, 'stream', 'object_id')
+    if len(tombstones) > limit:
+        has_more = True
+        tombstones = tombstones[:limit]
+    if tombstones:
+        positions['deleted'] = (tombstones[-1][1], tombstones[-1][0])
+    for _, _, stream, object_id in tombstones:
+        data[stream]['deleted'].append(object_id)
+
+    # Lists are sent whole, only when they differ from the synced ones.
+    if request.user.is_authenticated:
+        lists = get_lists(request.user)
+        version = get_lists_version(lists)
+        if positions.get('lists') != version:
+            data['lists'] = lists
+            positions['lists'] = version
+    data['has_more'] = has_more
+    return data, positions
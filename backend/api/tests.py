@@ -0,0 +1,584 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from threading import Barrier
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, router
+from django.db.utils import OperationalError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from foodgram.db_routers import (PrimaryReplicaRouter, reset_read_from_replica,
+                                 set_read_from_replica)
+from jobs.models import Job
+from recipes import meal_plan
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingList, Tag)
+from recipes.tasks import build_meal_plan_catalogue
+from users.models import Subscribe, User
+
+from . import authentication
+from .authentication import (CachedTokenAuthentication, SharedTokenCache,
+                             get_token_cache)
+from .fast_serializers import recipe_list_data, recipe_rows
+from .filters import RecipeFilter
+from .management.commands.explain_recipe_filters import INDEX_SCAN, Command
+from .renderers import FastJSONRenderer
+from .serializers import RecipeListSerializer
+from .utils import SparseFields, insert_ignore
+
+
+class ListToggleTests(TransactionTestCase):
+    """Parallel toggles of one recipe, as double clicks send them."""
+    threads = 8
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user',
+            first_name='Имя', last_name='Фамилия', password='pass-12345')
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipes/images/recipe.png')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def send_parallel(self, method, url):
+        """Send the request from all threads at once, return the statuses."""
+        barrier = Barrier(self.threads)
+
+        def send():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            barrier.wait()
+            try:
+                return getattr(client, method)(url).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(self.threads) as executor:
+            futures = [executor.submit(send) for _ in range(self.threads)]
+            return sorted(future.result() for future in futures)
+
+    def check_parallel(self, url_name, model):
+        url = reverse(url_name, args=[self.recipe.id])
+        rows = model.objects.filter(user=self.user, recipe=self.recipe)
+        self.assertEqual(
+            self.send_parallel('post', url),
+            [status.HTTP_201_CREATED]
+            + [status.HTTP_400_BAD_REQUEST] * (self.threads - 1))
+        self.assertEqual(rows.count(), 1)
+        self.assertEqual(
+            self.send_parallel('delete', url),
+            [status.HTTP_204_NO_CONTENT]
+            + [status.HTTP_400_BAD_REQUEST] * (self.threads - 1))
+        self.assertFalse(rows.exists())
+
+    def check_queries(self, url_name, model):
+        url = reverse(url_name, args=[self.recipe.id])
+        # Recipe lookup, then insert and outbox event in a transaction.
+        with self.assertNumQueries(5):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        with self.assertNumQueries(4):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # Delete and outbox event in a transaction.
+        with self.assertNumQueries(4):
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        with self.assertNumQueries(3):
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(model.objects.exists())
+
+    def test_favorite_parallel(self):
+        self.check_parallel('recipes-favorite', Favorite)
+
+    def test_shopping_cart_parallel(self):
+        self.check_parallel('recipes-shopping-cart', ShoppingList)
+
+    def test_favorite_queries(self):
+        self.check_queries('recipes-favorite', Favorite)
+
+    def test_shopping_cart_queries(self):
+        self.check_queries('recipes-shopping-cart', ShoppingList)
+
+    def test_insert_ignore_without_rows(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(insert_ignore(Favorite, []), [])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Query plans of PostgreSQL.')
+class RecipeFilterPlanTests(TestCase):
+    """Selective filters of the recipe list are served by their indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='pass-12345')
+        # Every 500th recipe matches. Reading the primary key backwards
+        # for the ten newest would go through the whole table.
+        recipes = []
+        for number in range(5000):
+            matches = number % 500 == 0
+            recipes.append(Recipe(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                image='recipes/images/recipe.png',
+                cooking_time=60 if matches else 5,
+                ingredients_count=2 if matches else 10,
+                ingredient_ids=[2, 3] if matches else [1]))
+        Recipe.objects.bulk_create(recipes)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE recipes_recipe')
+
+    def assertIndexUsed(self, params, index):
+        queryset = RecipeFilter(params, queryset=Recipe.objects.all()).qs
+        plan = Command.explain(recipe_rows(
+            queryset, AnonymousUser(), SparseFields())[:10])
+        self.assertIn(index, INDEX_SCAN.findall(plan), plan)
+
+    def test_cooking_time(self):
+        self.assertIndexUsed({'cooking_time_min': 30, 'cooking_time_max': 90},
+                             'recipe_cooking_time_idx')
+
+    def test_max_ingredients(self):
+        self.assertIndexUsed({'max_ingredients': 5},
+                             'recipe_ingredients_count_idx')
+
+    def test_with_ingredients(self):
+        self.assertIndexUsed({'with_ingredients': '2,3'},
+                             'recipe_ingredient_ids_idx')
+
+
+class RecipeIdFilterTests(TestCase):
+    """IDs in the recipe list filters are integers."""
+    client_class = APIClient
+
+    def test_integers(self):
+        filterset = RecipeFilter({'exclude_ingredients': '1,2',
+                                  'with_ingredients': '3',
+                                  'exclusion_profile': '4'},
+                                 queryset=Recipe.objects.all())
+        self.assertTrue(filterset.is_valid(), filterset.errors)
+        self.assertEqual(filterset.form.cleaned_data['exclude_ingredients'],
+                         [1, 2])
+        self.assertEqual(filterset.form.cleaned_data['with_ingredients'],
+                         [3])
+        self.assertEqual(filterset.form.cleaned_data['exclusion_profile'], 4)
+
+    def test_decimals_rejected(self):
+        for params in ({'exclude_ingredients': '1,3.5'},
+                       {'with_ingredients': '3.5'},
+                       {'exclusion_profile': '3.5'}):
+            with self.subTest(**params):
+                response = self.client.get(reverse('recipes-list'), params)
+                self.assertEqual(response.status_code,
+                                 status.HTTP_400_BAD_REQUEST)
+                self.assertIn(next(iter(params)), response.json())
+
+
+class ShoppingListTextTests(TestCase):
+    """Amounts in the downloaded list, units as data/ingredients.csv has."""
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('create_ingredients', stdout=StringIO())
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user',
+            first_name='Имя', last_name='Фамилия', password='pass-12345')
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.user, name=f'Рецепт {number}', text='Описание',
+                cooking_time=10, image='recipes/images/recipe.png')
+            for number in range(2)]
+        for recipe in cls.recipes:
+            ShoppingList.objects.create(user=cls.user, recipe=recipe)
+
+    def add(self, recipe, name, unit, amount):
+        ingredient, _ = Ingredient.objects.get_or_create(
+            name=name, measurement_unit=unit)
+        IngredientRecipe.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=amount)
+
+    def download(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse('recipes-download-shopping-cart'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.content.decode()
+
+    def test_units_of_one_quantity_add_up(self):
+        first, second = self.recipes
+        self.add(first, 'баранья лопатка', 'кг', 1)
+        self.add(second, 'баранья лопатка', 'г', 500)
+        self.add(first, 'бальзамический соус', 'ст. л.', 1)
+        self.add(second, 'бальзамический соус', 'ч. л.', 3)
+        self.add(first, 'апельсины красные', 'шт.', 2)
+        self.add(second, 'апельсины красные', 'шт', 3)
+        self.assertEqual(self.download(), (
+            'Список ингредиентов\n\n'
+            '<1> апельсины красные - 5, шт.\n'
+            '<2> бальзамический соус - 2, ст. л.\n'
+            '<3> баранья лопатка - 1500, г\n'))
+
+    def test_units_without_conversion(self):
+        first, second = self.recipes
+        self.add(first, 'авокадо', 'по вкусу', 1)
+        self.add(second, 'авокадо', 'по вкусу', 1)
+        self.add(first, 'пекарский порошок', 'г', 10)
+        self.add(second, 'пекарский порошок', 'ч. л.', 2)
+        self.assertEqual(self.download(), (
+            'Список ингредиентов\n\n'
+            '<1> авокадо - 2, по вкусу\n'
+            '<2> пекарский порошок - 10, г\n'
+            '<3> пекарский порошок - 2, ч. л.\n'))
+
+
+class TokenCacheTests(TestCase):
+    """A token revoked in one worker stops working in the others."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user',
+            first_name='Имя', last_name='Фамилия', password='pass-12345')
+        self.key = Token.objects.create(user=self.user).key
+        # Two workers: own cache objects over one cache backend.
+        self.workers = [SharedTokenCache('default', 60) for _ in range(2)]
+
+    def in_worker(self, number):
+        return mock.patch.object(
+            authentication, '_token_cache', self.workers[number])
+
+    def authenticate(self, number):
+        with self.in_worker(number):
+            return CachedTokenAuthentication().authenticate_credentials(
+                self.key)
+
+    def test_shared_cache_by_default(self):
+        with mock.patch.object(authentication, '_token_cache', None):
+            self.assertIsInstance(get_token_cache(), SharedTokenCache)
+
+    def test_logout(self):
+        self.authenticate(0)
+        with self.in_worker(1):
+            Token.objects.filter(key=self.key).delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(0)
+
+    def test_deactivation(self):
+        self.authenticate(0)
+        with self.in_worker(1):
+            self.user.is_active = False
+            self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(0)
+
+    def test_password_change(self):
+        self.authenticate(0)
+        with self.in_worker(1):
+            self.user.set_password('new-pass-12345')
+            self.user.save()
+        self.assertIsNone(self.workers[0].get(self.key))
+        user, _ = self.authenticate(0)
+        self.assertTrue(user.check_password('new-pass-12345'))
+
+
+@override_settings(SYNC={**settings.SYNC, 'SETTLE_SECONDS': 0})
+class SyncListsTests(TestCase):
+    """Favorite, cart and subscribe changes reach a synced client."""
+    client_class = APIClient
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user',
+            first_name='Имя', last_name='Фамилия', password='pass-12345')
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipes/images/recipe.png')
+        self.client.force_authenticate(self.user)
+
+    def sync(self, cursor=None):
+        response = self.client.get(
+            reverse('sync'), {'cursor': cursor} if cursor else {})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_lists_follow_changes(self):
+        data = self.sync()
+        self.assertEqual(data['lists'], {
+            'favorites': [], 'shopping_cart': [], 'subscriptions': []})
+        recipe = data['recipes']['updated'][0]
+        self.assertNotIn('is_favorited', recipe)
+        self.assertNotIn('is_in_shopping_cart', recipe)
+        self.assertNotIn('is_subscribed', recipe['author'])
+
+        self.assertNotIn('lists', self.sync(data['cursor']))
+        self.client.post(reverse('recipes-favorite', args=[self.recipe.id]))
+        data = self.sync(data['cursor'])
+        self.assertEqual(data['lists']['favorites'], [self.recipe.id])
+        self.assertEqual(data['recipes']['updated'], [])
+        self.assertNotIn('lists', self.sync(data['cursor']))
+
+
+class ProfileCacheTests(TransactionTestCase):
+    """Cached author profiles follow profile changes."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user',
+            first_name='Имя', last_name='Фамилия', password='pass-12345')
+        Recipe.objects.create(
+            author=self.user, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipes/images/recipe.png')
+        self.client = APIClient()
+
+    def get_author_name(self):
+        response = self.client.get(reverse('recipes-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()['results'][0]['author']['first_name']
+
+    def test_patch_me_then_list(self):
+        self.assertEqual(self.get_author_name(), 'Имя')
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.patch(reverse('users-me-get'),
+                                {'first_name': 'Новое'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get_author_name(), 'Новое')
+
+
+class MealPlanTests(TestCase):
+    """Plans with the fewest ingredients from the stored catalogue."""
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user',
+            first_name='Имя', last_name='Фамилия', password='pass-12345')
+        tags = {slug: Tag.objects.create(name=slug, color=color, slug=slug)
+                for slug, color in (('breakfast', '#E26C2D'),
+                                    ('dinner', '#49B64E'))}
+        ingredients = {name: Ingredient.objects.create(
+            name=name, measurement_unit='г') for name in 'abpqrxyz'}
+        cls.recipes = {}
+        rows = []
+        for name, tag, names in (('B1', 'breakfast', 'a'),
+                                 ('B2', 'breakfast', 'a'),
+                                 ('B3', 'breakfast', 'xyz'),
+                                 ('D1', 'dinner', 'a'),
+                                 ('D2', 'dinner', 'b'),
+                                 ('D3', 'dinner', 'pqr')):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=name, text='Описание',
+                cooking_time=10, image='recipes/images/recipe.png')
+            recipe.tags.add(tags[tag])
+            rows.extend(IngredientRecipe(recipe=recipe, amount=1,
+                                         ingredient=ingredients[letter])
+                        for letter in names)
+            cls.recipes[name] = recipe.id
+        IngredientRecipe.objects.bulk_create(rows)
+
+    def setUp(self):
+        cache.clear()
+        meal_plan._catalogue.update(version=None, recipes=None)
+        self.client.force_authenticate(self.user)
+
+    def plan(self, **data):
+        return self.client.post(reverse('recipes-meal-plan'),
+                                {'tags': ['breakfast', 'dinner'], **data},
+                                format='json')
+
+    def planned(self, response, tag):
+        return {day[tag]['id'] for day in response.json()['days']}
+
+    def test_fewest_ingredients(self):
+        response = self.plan(days=2, add_to_shopping_cart=True)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['ingredients_count'], 2)
+        self.assertEqual(self.planned(response, 'breakfast'),
+                         {self.recipes['B1'], self.recipes['B2']})
+        self.assertEqual(self.planned(response, 'dinner'),
+                         {self.recipes['D1'], self.recipes['D2']})
+        self.assertEqual(response.json()['added_to_shopping_cart'], 4)
+        self.assertEqual(ShoppingList.objects.filter(user=self.user).count(),
+                         4)
+
+    def test_not_enough_recipes(self):
+        response = self.plan(days=4)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_catalogue_built_once(self):
+        self.plan(days=1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.plan(days=1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([query for query in queries
+                          if 'recipes_ingredientrecipe' in query['sql']])
+
+    def test_recipe_change_rebuilds_catalogue(self):
+        self.plan(days=1)
+        recipe = Recipe.objects.get(pk=self.recipes['D2'])
+        recipe.cooking_time = 120
+        recipe.save()
+        self.assertTrue(Job.objects.filter(
+            task='recipes.tasks.build_meal_plan_catalogue',
+            status=Job.Status.PENDING).exists())
+        build_meal_plan_catalogue()
+        response = self.plan(days=2, max_cooking_time=60)
+        self.assertEqual(self.planned(response, 'dinner'),
+                         {self.recipes['D1'], self.recipes['D3']})
+
+
+class RecipeListDataTests(TestCase):
+    """recipe_list_data renders the same bytes as RecipeListSerializer."""
+    queries = (
+        {},
+        {'fields': 'id,name,cooking_time'},
+        {'fields': 'id,tags,author,ingredients'},
+        {'fields': 'id,tags,author,ingredients',
+         'expand': 'tags,author,ingredients'},
+        {'fields': 'author,is_favorited,is_in_shopping_cart',
+         'expand': 'author'},
+        {'fields': 'ingredients,image,text', 'expand': 'ingredients'},
+        {'fields': 'unknown'},
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer, cls.author = (User.objects.create_user(
+            email=f'{name}@example.com', username=name,
+            first_name='Имя', last_name='Фамилия', password='pass-12345')
+            for name in ('viewer', 'author'))
+        tags = [Tag.objects.create(name=name, color=color, slug=slug)
+                for name, color, slug in (('Завтрак', '#E26C2D', 'breakfast'),
+                                          ('Ужин', '#49B64E', 'dinner'))]
+        ingredients = [Ingredient.objects.create(
+            name=name, measurement_unit='г') for name in ('Соль', 'Мука')]
+        rows = []
+        for author, number in ((cls.viewer, 1), (cls.author, 2),
+                               (cls.author, 3)):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт "{number}"',
+                text='Описание\n\u2028с эмодзи \U0001F957',
+                cooking_time=number * 10,
+                image=f'recipes/images/recipe-{number}.png')
+            recipe.tags.set(tags[:number])
+            rows.extend(IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                                         amount=number * 100 - index)
+                        for index, ingredient in enumerate(ingredients))
+            if number > 1:
+                Favorite.objects.create(user=cls.viewer, recipe=recipe)
+            if number == 3:
+                ShoppingList.objects.create(user=cls.viewer, recipe=recipe)
+        IngredientRecipe.objects.bulk_create(rows)
+        Subscribe.objects.create(user=cls.viewer, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self, params, user):
+        request = Request(APIRequestFactory().get('/api/recipes/', params))
+        request.user = user
+        queryset = Recipe.objects.all()
+        sparse = SparseFields(request)
+        slow = RecipeListSerializer(queryset, many=True,
+                                    context={'request': request}).data
+        fast = recipe_list_data(recipe_rows(queryset, user, sparse), user,
+                                sparse)
+        renderer = FastJSONRenderer()
+        return renderer.render(slow), renderer.render(fast)
+
+    def test_same_bytes(self):
+        for user in (AnonymousUser(), self.viewer):
+            for params in self.queries:
+                with self.subTest(user=user, **params):
+                    slow, fast = self.render(params, user)
+                    self.assertEqual(fast, slow)
+
+
+REPLICA = 'replica_test'
+# A replica alias mirroring the test database, registered before the test
+# runner sets up the databases the test cases use.
+connections.settings.setdefault(REPLICA, {
+    **connections.settings['default'], 'TEST': {'MIRROR': 'default'}})
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class ReplicaRoutingTests(TestCase):
+    """Safe requests read from a second database alias."""
+    databases = {'default', REPLICA}
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user',
+            first_name='Имя', last_name='Фамилия', password='pass-12345')
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipes/images/recipe.png')
+
+    def setUp(self):
+        cache.clear()
+        self.router = next(router for router in router.routers
+                           if isinstance(router, PrimaryReplicaRouter))
+        self.router._health.clear()
+
+    def get_aliases(self, method, path):
+        """Aliases of the databases queried by the request."""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = getattr(self.client, method)(path)
+        self.assertLess(response.status_code, 400)
+        return {alias for alias, queries in (('default', primary),
+                                             (REPLICA, replica))
+                if queries}
+
+    def test_safe_reads_use_replica(self):
+        self.assertEqual(self.get_aliases('get', reverse('tags-list')),
+                         {REPLICA})
+
+    def test_pinned_to_primary_after_write(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.get_aliases('post', reverse(
+            'recipes-favorite', args=(self.recipe.id,))), {'default'})
+        self.assertEqual(self.get_aliases('get', reverse('tags-list')),
+                         {'default'})
+        cache.clear()
+        self.assertEqual(self.get_aliases('get', reverse('tags-list')),
+                         {REPLICA})
+
+    def test_unavailable_replica(self):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica, \
+                mock.patch.object(connections[REPLICA], 'ensure_connection',
+                                  side_effect=OperationalError) as ensure:
+            for _ in range(2):
+                response = self.client.get(reverse('tags-list'))
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(primary.captured_queries)
+        self.assertFalse(replica.captured_queries)
+        self.assertEqual(ensure.call_count, 1)
+
+    def test_health_is_cached(self):
+        token = set_read_from_replica(True)
+        self.addCleanup(reset_read_from_replica, token)
+        with mock.patch.object(connections[REPLICA],
+                               'ensure_connection') as ensure:
+            for _ in range(3):
+                self.assertEqual(self.router.db_for_read(Recipe), REPLICA)
+        self.assertEqual(ensure.call_count, 1)
@@ -0,0 +1,161 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import Throttled
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from users.hashers import PasswordHashingBusy, hashing_timeout
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """Turn '30/min' into (capacity, tokens refilled per second)."""
+    number, period = rate.split('/')
+    capacity = int(number)
+    return capacity, capacity / PERIODS[period[0]]
+
+
+def refill(bucket, capacity, refill_rate, now):
+    tokens, updated = bucket[:2] if bucket else (capacity, now)
+    return min(capacity, tokens + (now - updated) * refill_rate)
+
+
+class LocMemBucketStore:
+    """Buckets kept in the memory of the current process."""
+    max_keys = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, key, capacity, refill_rate):
+        """Take a token, return (allowed, tokens left, wait seconds)."""
+        now = time.monotonic()
+        with self._lock:
+            if len(self._buckets) >= self.max_keys:
+                self._prune(now)
+            tokens = refill(self._buckets.get(key), capacity,
+                            refill_rate, now)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            full_at = now + (capacity - tokens) / refill_rate
+            self._buckets[key] = (tokens, now, full_at)
+        return allowed, tokens, (1 - tokens) / refill_rate
+
+    def _prune(self, now):
+        """Forget buckets that have refilled completely."""
+        self._buckets = {key: bucket for key, bucket in self._buckets.items()
+                         if bucket[2] > now}
+
+
+class CacheBucketStore:
+    """Buckets shared between processes through a Django cache.
+
+    Reading and writing a bucket is not atomic, concurrent requests of
+    one client may occasionally both get the last token.
+    """
+
+    def __init__(self):
+        self.cache = caches[settings.THROTTLE_CACHE]
+
+    def take(self, key, capacity, refill_rate):
+        now = time.time()
+        tokens = refill(self.cache.get(key), capacity, refill_rate, now)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self.cache.set(key, (tokens, now), int(capacity / refill_rate) + 1)
+        return allowed, tokens, (1 - tokens) / refill_rate
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = import_string(settings.THROTTLE_BUCKET_STORE)()
+    return _store
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Token bucket throttle for views and actions with throttle_scope.
+
+    The rate of a scope, e.g. '30/min', is both the bucket capacity
+    and its refill speed. Remaining quota is kept on the request for
+    ThrottleHeadersMixin.
+    """
+    rate_suffix = ''
+
+    def get_ident_key(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(
+            f'{scope}{self.rate_suffix}')
+        if scope is None or rate is None:
+            return True
+        capacity, refill_rate = parse_rate(rate)
+        key = (f'throttle:{scope}{self.rate_suffix}:'
+               f'{self.get_ident_key(request)}')
+        allowed, tokens, self._wait = get_store().take(
+            key, capacity, refill_rate)
+        quotas = getattr(request, 'throttle_quotas', [])
+        quotas.append((capacity, int(tokens)))
+        request.throttle_quotas = quotas
+        return allowed
+
+    def wait(self):
+        return self._wait
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """Per user limits, anonymous requests are limited per IP."""
+
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """Per IP limits configured as '<scope>_ip' rates."""
+    rate_suffix = '_ip'
+
+    def get_ident_key(self, request):
+        return self.get_ident(request)
+
+
+class ThrottleHeadersMixin:
+    """Report the most restrictive throttle quota in response headers."""
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        quotas = getattr(request, 'throttle_quotas', None)
+        if quotas:
+            limit, remaining = min(quotas, key=lambda quota: quota[1])
+            response['X-RateLimit-Limit'] = limit
+            response['X-RateLimit-Remaining'] = remaining
+        return response
+
+
+class PasswordHashingMixin:
+    """Answer 429 when no password hashing slot gets free in time."""
+
+    def dispatch(self, request, *args, **kwargs):
+        with hashing_timeout():
+            return super().dispatch(request, *args, **kwargs)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, PasswordHashingBusy):
+            exc = Throttled(exc.wait, 'Too many password checks in progress,'
+                                      ' try again later.')
+        return super().handle_exception(exc)
@@ -1,8 +1,12 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
+from rest_framework_simplejwt.views import TokenBlacklistView, TokenRefreshView
 
-from .views import (CustomUserViewSet, IngredientViewSet, RecipeViewSet,
-                    TagViewSet)
+from .serializers import JWTLogoutSerializer, JWTRefreshSerializer
+from .views import (CatalogueView, CustomUserViewSet, ExclusionProfileViewSet,
+                    IngredientViewSet, JWTCreateView, MetricsView,
+                    RecipeViewSet, SyncView, TagViewSet, TokenCreateView)
 
 router = DefaultRouter()
 
@@ -10,10 +14,25 @@ router.register('users', CustomUserViewSet, basename='users')
 router.register('tags', TagViewSet, basename='tags')
 router.register('ingredients', IngredientViewSet, basename='ingredients')
 router.register('recipes', RecipeViewSet, basename='recipes')
+router.register('exclusion_profiles', ExclusionProfileViewSet,
+                basename='exclusion_profiles')
 
 
 urlpatterns = [
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('catalogue/', CatalogueView.as_view(), name='catalogue'),
     path('', include(router.urls)),
     path('', include('djoser.urls')),
+    path('auth/token/login/', TokenCreateView.as_view(), name='login'),
     path('auth/', include('djoser.urls.authtoken'))
 ]
+
+if settings.JWT_AUTH_ENABLED:
+    urlpatterns += [
+        path('auth/jwt/create/', JWTCreateView.as_view(), name='jwt-create'),
+        path('auth/jwt/refresh/', TokenRefreshView.as_view(
+            serializer_class=JWTRefreshSerializer), name='jwt-refresh'),
+        path('auth/jwt/logout/', TokenBlacklistView.as_view(
+            serializer_class=JWTLogoutSerializer), name='jwt-logout'),
+    ]
@@ -1,13 +1,85 @@
-from django.db.models import Sum
+from django.db import connections, router
 from django.shortcuts import HttpResponse
 
+from recipes.units import merge_amounts
+
+
+def insert_ignore(model, rows, returning='id'):
+    """Insert rows skipping the ones that violate a unique constraint.
+
+    Runs a single INSERT ... ON CONFLICT DO NOTHING RETURNING statement,
+    so concurrent inserts of the same row never raise IntegrityError.
+    Returns the `returning` column of the rows actually inserted.
+    """
+    if not rows:
+        return []
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    fields = [model._meta.get_field(name) for name in rows[0]]
+    columns = ', '.join(quote(field.column) for field in fields)
+    values = ', '.join(
+        ['(' + ', '.join(['%s'] * len(fields)) + ')'] * len(rows))
+    params = [field.get_db_prep_save(row[field.attname], connection)
+              for row in rows for field in fields]
+    returning = quote(model._meta.get_field(returning).column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(model._meta.db_table)} ({columns}) '
+            f'VALUES {values} ON CONFLICT DO NOTHING RETURNING {returning}',
+            params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def delete_returning(model, returning='id', **lookups):
+    """Delete rows in a single DELETE ... RETURNING statement.
+
+    Lookups are exact matches on columns, list values turn into IN.
+    Returns the `returning` column of the deleted rows.
+    """
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    conditions, params = [], []
+    for name, value in lookups.items():
+        field = model._meta.get_field(name)
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        if not values:
+            return []
+        conditions.append(
+            f'{quote(field.column)} IN ({", ".join(["%s"] * len(values))})')
+        params.extend(field.get_db_prep_value(item, connection)
+                      for item in values)
+    returning = quote(model._meta.get_field(returning).column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} '
+            f'WHERE {" AND ".join(conditions)} RETURNING {returning}',
+            params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+class SparseFields:
+    """Fields requested with ?fields=a,b, nested ones expanded by ?expand=.
+
+    Without ?fields= every field is returned expanded, as before.
+    """
+
+    def __init__(self, request=None):
+        params = request.query_params if request is not None else {}
+        fields = params.get('fields')
+        self.fields = set(fields.split(',')) if fields else None
+        self.expand = set(params.get('expand', '').split(','))
+
+    def wants(self, name):
+        return self.fields is None or name in self.fields
+
+    def expands(self, name):
+        return self.fields is None or name in self.expand
+
 
 def txt_generation(value_list):
-    # Аннотация queryset с суммой количества ингредиентов
-    queryset = (value_list.values(
-        'ingredient__name',
-        'ingredient__measurement_unit').annotate(
-        total_amount=Sum('amount')))
+    # Суммы по ингредиентам с одинаковым названием, количества в разных
+    # единицах одной величины (г и кг, мл и ложки) складываются
+    ingredients = merge_amounts(value_list)
 
     # Создание текстового файла
     response = HttpResponse(content_type='text/plain')
@@ -18,9 +90,9 @@ def txt_generation(value_list):
 
     # Запись данных в текстовый файл
     response.write('Список ингредиентов\n\n')
-    for i, item in enumerate(queryset, 1):
+    for i, item in enumerate(ingredients, 1):
         response.write(
-            f'<{i}> {item["ingredient__name"]} - {item["total_amount"]},'
-            f' {item["ingredient__measurement_unit"]}\n'
+            f'<{i}> {item["name"]} - {item["amount"]},'
+            f' {item["measurement_unit"]}\n'
         )
     return response
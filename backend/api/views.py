@@ -1,27 +1,61 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth import update_session_auth_hash
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser import utils
+from djoser import views as djoser_views
 from djoser.conf import settings as sett
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import SAFE_METHODS, IsAuthenticatedOrReadOnly
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ReadOnlyModelViewSet
+from rest_framework_simplejwt.views import TokenObtainPairView
 
-from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingList, Tag)
+from events.outbox import emit
+from recipes.catalogue import build_bundle, get_url, get_version
+from recipes.meal_plan import MealPlanError, plan_meals
+from recipes.models import (ExclusionProfile, Favorite, Ingredient,
+                            IngredientRecipe, Recipe, ShoppingList,
+                            SimilarRecipe, Tag)
 from users.models import Subscribe, User
 
+from .fast_serializers import recipe_list_data, recipe_rows, recipes_by_ids
 from .filters import IngredientFilter, RecipeFilter
+from .metrics import registry
 from .pagination import LimitPageNumberPagination
 from .permissions import IsAuthorOrAdminOrReadOnly
+from .profiles import forget_following
+from .recipe_details import get_detail
+from .renderers import FastJSONRenderer, PrometheusRenderer
 from .serializers import (CustomUserCreateSerializer, CustomUserSerializer,
-                          IngredientSerializer, RecipeCreateSerializer,
+                          ExclusionProfileSerializer, IngredientSerializer,
+                          JWTObtainPairSerializer, MealPlanSerializer,
+                          RecipeCreateSerializer, RecipeIdsSerializer,
                           RecipeListSerializer, RecipeSubSerializer,
                           SetPasswordSerializer, SubscribeSerializer,
                           TagSerializer)
-from .utils import txt_generation
+from .sync import decode_cursor, encode_cursor, get_changes
+from .throttling import PasswordHashingMixin, ThrottleHeadersMixin
+from .utils import (SparseFields, delete_returning, insert_ignore,
+                    txt_generation)
+
+
+def sparse_users(queryset, request):
+    """Load only the user columns requested with ?fields=."""
+    sparse = SparseFields(request)
+    if sparse.fields is None:
+        return queryset
+    return queryset.only('id', *(
+        field.attname for field in User._meta.concrete_fields
+        if sparse.wants(field.attname)))
 
 
 class TagViewSet(ReadOnlyModelViewSet):
@@ -29,6 +63,7 @@ class TagViewSet(ReadOnlyModelViewSet):
     serializer_class = TagSerializer
     pagination_class = None
     permission_classes = (IsAuthenticatedOrReadOnly,)
+    renderer_classes = (FastJSONRenderer, BrowsableAPIRenderer)
 
 
 class IngredientViewSet(ReadOnlyModelViewSet):
@@ -36,17 +71,36 @@ class IngredientViewSet(ReadOnlyModelViewSet):
     serializer_class = IngredientSerializer
     pagination_class = None
     permission_classes = (IsAuthenticatedOrReadOnly,)
+    renderer_classes = (FastJSONRenderer, BrowsableAPIRenderer)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
 
 
-class CustomUserViewSet(viewsets.ModelViewSet):
+class ExclusionProfileViewSet(viewsets.ModelViewSet):
+    """Ingredient sets the user applies with ?exclusion_profile=."""
+    serializer_class = ExclusionProfileSerializer
+    pagination_class = None
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get_queryset(self):
+        return ExclusionProfile.objects.filter(
+            user=self.request.user).prefetch_related('ingredients')
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+
+class CustomUserViewSet(PasswordHashingMixin, ThrottleHeadersMixin,
+                        viewsets.ModelViewSet):
     """ViewSet for Users performance."""
     queryset = User.objects.all()
     filter_backends = (DjangoFilterBackend,)
     filterset_fields = ('username', 'email')
     serializer_class = CustomUserSerializer
     pagination_class = LimitPageNumberPagination
+    renderer_classes = (FastJSONRenderer, BrowsableAPIRenderer)
+    lookup_value_regex = r'\d+'
+    throttle_scope = None
 
     @action(["post"], detail=False)
     def set_password(self, request, *args, **kwargs):
@@ -63,8 +117,13 @@ class CustomUserViewSet(viewsets.ModelViewSet):
             update_session_auth_hash(self.request, self.request.user)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def get_throttles(self):
+        if self.action == 'create':
+            self.throttle_scope = 'signup'
+        return super().get_throttles()
+
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = sparse_users(super().get_queryset(), self.request)
         limit = self.request.query_params.get('limit')
         if limit:
             queryset = queryset[:int(limit)]
@@ -85,18 +144,15 @@ class CustomUserViewSet(viewsets.ModelViewSet):
     )
     def me_get(self, request):
         """View for authenticated user to retrieve their profile."""
+        request.user.refresh_from_db(fields=request.user.get_deferred_fields())
         serializer = CustomUserSerializer(request.user,
                                           context={'request': request})
         return Response(serializer.data, status=status.HTTP_200_OK)
 
-    @action(
-        detail=False,
-        url_path='me',
-        methods=['patch'],
-        permission_classes=[permissions.IsAuthenticated]
-    )
+    @me_get.mapping.patch
     def me_patch(self, request):
         """View for authenticated user to update their profile."""
+        request.user.refresh_from_db(fields=request.user.get_deferred_fields())
         serializer = self.get_serializer(request.user,
                                          data=request.data,
                                          partial=True)
@@ -114,7 +170,8 @@ class CustomUserViewSet(viewsets.ModelViewSet):
         """View to list subscriptions of the authenticated user."""
         subscriptions = Subscribe.objects.filter(user=request.user)
         authors_ids = subscriptions.values_list('author_id', flat=True)
-        authors = User.objects.filter(id__in=authors_ids)
+        authors = sparse_users(
+            User.objects.filter(id__in=authors_ids), request)
         result_page = self.paginate_queryset(authors)
         serializer = SubscribeSerializer(
             result_page,
@@ -126,7 +183,8 @@ class CustomUserViewSet(viewsets.ModelViewSet):
         detail=True,
         methods=('post', 'delete'),
         url_path='subscribe',
-        permission_classes=(permissions.IsAuthenticated,)
+        permission_classes=(permissions.IsAuthenticated,),
+        throttle_scope='subscribe',
     )
     def subscribe(self, request, *args, **kwargs):
         """Action to handle user subscribe and unsubscribe."""
@@ -135,95 +193,229 @@ class CustomUserViewSet(viewsets.ModelViewSet):
             serializer = SubscribeSerializer(
                 author, data=request.data, context={'request': request})
             serializer.is_valid(raise_exception=True)
-            Subscribe.objects.create(user=request.user, author=author)
+            row = {'user_id': request.user.id, 'author_id': author.id}
+            with transaction.atomic():
+                if not insert_ignore(Subscribe, [row]):
+                    return Response(
+                        {'errors': f'You already subscribed on {author}.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+                emit(Subscribe, 'created', [row])
+                # insert_ignore() and delete_returning() send no signals.
+                forget_following(request.user.id)
             return Response(serializer.data,
                             status=status.HTTP_201_CREATED)
 
-        if request.method == 'DELETE':
-            author = get_object_or_404(User, id=kwargs['pk'])
-            subscription = Subscribe.objects.filter(
-                user=request.user, author=author).first()
-            if subscription:
-                subscription.delete()
-                return Response({'detail': 'Unsubscribed'},
-                                status=status.HTTP_204_NO_CONTENT)
-            else:
-                return Response({'detail': 'There is no active sub'},
-                                status=status.HTTP_400_BAD_REQUEST)
+        row = {'user_id': request.user.id, 'author_id': int(kwargs['pk'])}
+        with transaction.atomic():
+            removed = delete_returning(Subscribe, **row)
+            emit(Subscribe, 'deleted', [row] if removed else [])
+            if removed:
+                forget_following(request.user.id)
+        if removed:
+            return Response({'detail': 'Unsubscribed'},
+                            status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(User, id=kwargs['pk'])
+        return Response({'detail': 'There is no active sub'},
+                        status=status.HTTP_400_BAD_REQUEST)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ThrottleHeadersMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = [IsAuthorOrAdminOrReadOnly]
     pagination_class = LimitPageNumberPagination
+    renderer_classes = (FastJSONRenderer, BrowsableAPIRenderer)
+    lookup_value_regex = r'\d+'
+    throttle_scope = None
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeListSerializer
         return RecipeCreateSerializer
 
-    @action(detail=True, methods=['post', 'delete'], url_path='favorite',
-            permission_classes=[permissions.IsAuthenticated])
-    def favorite(self, request, pk):
-        if request.method == 'POST':
-            try:
-                Recipe.objects.get(pk=pk)
-            except Recipe.DoesNotExist:
+    def list(self, request, *args, **kwargs):
+        """Same output as RecipeListSerializer, built from plain rows."""
+        sparse = SparseFields(request)
+        rows = recipe_rows(self.filter_queryset(self.get_queryset()),
+                           request.user, sparse)
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(recipe_list_data(rows, request.user, sparse))
+        return self.get_paginated_response(
+            recipe_list_data(page, request.user, sparse))
+
+    def retrieve(self, request, *args, **kwargs):
+        """Prerendered recipe with the flags of the user."""
+        data = get_detail(int(kwargs['pk']), request.user,
+                          SparseFields(request))
+        if data is None:
+            raise NotFound
+        return Response(data)
+
+    def get_throttles(self):
+        if self.action == 'create':
+            self.throttle_scope = 'recipe_create'
+        return super().get_throttles()
+
+    def emit_list_events(self, model, action, recipe_ids):
+        emit(model, action, [{'user_id': self.request.user.id,
+                              'recipe_id': recipe_id}
+                             for recipe_id in recipe_ids])
+
+    def add_to_list(self, model, pk):
+        """Add a recipe to the favorites or the shopping cart of the user."""
+        recipe = Recipe.objects.filter(pk=pk).first()
+        if recipe is None:
+            return Response({'errors': 'Recipe does not exist'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            if not insert_ignore(model, [{'user_id': self.request.user.id,
+                                          'recipe_id': recipe.id}]):
                 return Response(
-                    {'errors': 'Recipe does not exist'},
+                    {'errors': 'Recipe is already added in list'},
                     status=status.HTTP_400_BAD_REQUEST)
+            self.emit_list_events(model, 'created', [recipe.id])
+        serializer = RecipeSubSerializer(recipe)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-            if Favorite.objects.filter(
-                    user=request.user, recipe__id=pk).exists():
-                return Response({'errors': 'Recipe is already added in list'},
-                                status=status.HTTP_400_BAD_REQUEST)
-            recipe = get_object_or_404(Recipe, id=pk)
-            Favorite.objects.create(user=request.user, recipe=recipe)
-            serializer = RecipeSubSerializer(recipe)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+    def remove_from_list(self, model, pk):
+        with transaction.atomic():
+            removed = delete_returning(model, 'recipe_id',
+                                       user_id=self.request.user.id,
+                                       recipe_id=pk)
+            self.emit_list_events(model, 'deleted', removed)
+        if removed:
+            return Response({'detail': 'Removed'},
+                            status=status.HTTP_204_NO_CONTENT)
+        return Response({'errors': 'Recipe is already deleted'},
+                        status=status.HTTP_400_BAD_REQUEST)
 
+    def change_list(self, model, request):
+        """Add or remove many recipes at once, report result per ID."""
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['ids']))
+        user_id = request.user.id
         if request.method == 'DELETE':
-            try:
-                obj = get_object_or_404(Favorite.objects.filter(
-                    user=request.user, recipe__id=pk))
-                obj.delete()
-                return Response({'detail': 'Removed'},
-                                status=status.HTTP_204_NO_CONTENT)
-            except Favorite.DoesNotExist:
-                return Response({'errors': 'Recipe is already deleted'},
-                                status=status.HTTP_400_BAD_REQUEST)
+            with transaction.atomic():
+                removed = set(delete_returning(
+                    model, 'recipe_id', user_id=user_id, recipe_id=ids))
+                self.emit_list_events(model, 'deleted', removed)
+            results = [{'id': recipe_id,
+                        'status': ('removed' if recipe_id in removed
+                                   else 'not_in_list')}
+                       for recipe_id in ids]
+            return Response({'results': results})
+
+        existing = set(Recipe.objects.filter(
+            id__in=ids).values_list('id', flat=True))
+        with transaction.atomic():
+            added = set(insert_ignore(
+                model, [{'user_id': user_id, 'recipe_id': recipe_id}
+                        for recipe_id in ids if recipe_id in existing],
+                'recipe_id'))
+            self.emit_list_events(model, 'created', added)
+        results = []
+        for recipe_id in ids:
+            if recipe_id in added:
+                result = 'added'
+            elif recipe_id in existing:
+                result = 'already_added'
+            else:
+                result = 'not_found'
+            results.append({'id': recipe_id, 'status': result})
+        return Response({'results': results})
+
+    @action(detail=True, methods=['post', 'delete'], url_path='favorite',
+            permission_classes=[permissions.IsAuthenticated],
+            throttle_scope='favorite')
+    def favorite(self, request, pk):
+        if request.method == 'POST':
+            return self.add_to_list(Favorite, pk)
+        return self.remove_from_list(Favorite, pk)
 
     @action(detail=True, methods=['post', 'delete'], url_path='shopping_cart',
-            permission_classes=[permissions.IsAuthenticated])
+            permission_classes=[permissions.IsAuthenticated],
+            throttle_scope='shopping_cart')
     def shopping_cart(self, request, pk):
         if request.method == 'POST':
-            try:
-                Recipe.objects.get(pk=pk)
-            except Recipe.DoesNotExist:
-                return Response({'errors': 'Recipe does not exist'},
-                                status=status.HTTP_400_BAD_REQUEST)
-            if ShoppingList.objects.filter(user=request.user,
-                                           recipe__id=pk).exists():
-                return Response({'errors': 'Recipe is already existed'},
-                                status=status.HTTP_400_BAD_REQUEST)
-            recipe = get_object_or_404(Recipe, id=pk)
-            ShoppingList.objects.create(user=request.user, recipe=recipe)
-            serializer = RecipeSubSerializer(recipe)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            return self.add_to_list(ShoppingList, pk)
+        return self.remove_from_list(ShoppingList, pk)
 
-        if request.method == 'DELETE':
-            try:
-                obj = get_object_or_404(
-                    ShoppingList.objects.filter(
-                        user=request.user, recipe__id=pk))
-                obj.delete()
-                return Response(
-                    {'detail': 'Removed'}, status=status.HTTP_204_NO_CONTENT)
-            except ShoppingList.DoesNotExist:
-                return Response({'errors': 'Recipe is already deleted'},
-                                status=status.HTTP_400_BAD_REQUEST)
+    @action(detail=False, methods=['post', 'delete'], url_path='favorite',
+            url_name='favorite-batch',
+            permission_classes=[permissions.IsAuthenticated],
+            throttle_scope='favorite')
+    def favorite_batch(self, request):
+        return self.change_list(Favorite, request)
+
+    @action(detail=False, methods=['post', 'delete'], url_path='shopping_cart',
+            url_name='shopping-cart-batch',
+            permission_classes=[permissions.IsAuthenticated],
+            throttle_scope='shopping_cart')
+    def shopping_cart_batch(self, request):
+        return self.change_list(ShoppingList, request)
+
+    @action(detail=False, methods=['delete'], url_path='shopping_cart/clear',
+            permission_classes=[permissions.IsAuthenticated],
+            throttle_scope='shopping_cart')
+    def clear_shopping_cart(self, request):
+        with transaction.atomic():
+            removed = delete_returning(
+                ShoppingList, 'recipe_id', user_id=request.user.id)
+            self.emit_list_events(ShoppingList, 'deleted', removed)
+        return Response({'removed': len(removed)})
+
+    @action(detail=True, methods=['get'], url_path='similar')
+    def similar(self, request, pk):
+        """Precomputed most similar recipes, ?limit= of them."""
+        neighbors = settings.SIMILAR_RECIPES['NEIGHBORS']
+        try:
+            limit = min(int(request.query_params.get('limit', neighbors)),
+                        neighbors)
+        except ValueError:
+            raise ValidationError({'limit': 'A number is required.'})
+        ids = list(SimilarRecipe.objects.filter(recipe_id=pk).order_by(
+            '-score').values_list('similar_id', flat=True)[:max(limit, 0)])
+        if not ids:
+            get_object_or_404(Recipe, pk=pk)
+        return Response(
+            recipes_by_ids(ids, request.user, SparseFields(request)))
+
+    @action(detail=False, methods=['post'], url_path='meal_plan',
+            permission_classes=[permissions.IsAuthenticated],
+            throttle_scope='meal_plan')
+    def meal_plan(self, request):
+        """Plan meals needing the fewest distinct ingredients."""
+        serializer = MealPlanSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            plan, ingredients_count = plan_meals(
+                data['tags'], data['days'], data.get('max_cooking_time'))
+        except MealPlanError as error:
+            raise ValidationError({'tags': str(error)})
+        recipe_ids = [recipe_id for day in plan
+                      for recipe_id in day.values()]
+        recipes = Recipe.objects.in_bulk(recipe_ids)
+        added = []
+        if data['add_to_shopping_cart']:
+            with transaction.atomic():
+                added = insert_ignore(
+                    ShoppingList,
+                    [{'user_id': request.user.id, 'recipe_id': recipe_id}
+                     for recipe_id in recipe_ids],
+                    'recipe_id')
+                self.emit_list_events(ShoppingList, 'created', added)
+        return Response({
+            'ingredients_count': ingredients_count,
+            'days': [
+                {tag: RecipeSubSerializer(recipes[recipe_id]).data
+                 for tag, recipe_id in day.items()}
+                for day in plan],
+            'added_to_shopping_cart': len(added),
+        })
 
     @action(detail=False, methods=['get'], url_path='download_shopping_cart',
             permission_classes=[permissions.IsAuthenticated])
@@ -234,3 +426,77 @@ class RecipeViewSet(viewsets.ModelViewSet):
             .select_related('ingredient')
         )
         return txt_generation(ingredient_queryset)
+
+
+class TokenCreateView(PasswordHashingMixin, ThrottleHeadersMixin,
+                      djoser_views.TokenCreateView):
+    """Token login limited by the 'login' throttle scope."""
+    throttle_scope = 'login'
+
+
+class JWTCreateView(PasswordHashingMixin, ThrottleHeadersMixin,
+                    TokenObtainPairView):
+    serializer_class = JWTObtainPairSerializer
+    throttle_scope = 'login'
+
+
+class MetricsView(APIView):
+    """Request metrics of this process in the Prometheus format."""
+    permission_classes = (permissions.IsAdminUser,)
+    renderer_classes = (PrometheusRenderer,)
+
+    def get(self, request):
+        return Response(registry.render())
+
+
+class CatalogueView(APIView):
+    """Version and URL of the static bundle of tags and ingredients."""
+    permission_classes = (permissions.AllowAny,)
+    renderer_classes = (FastJSONRenderer, BrowsableAPIRenderer)
+
+    def get(self, request):
+        version = get_version() or build_bundle()
+        return Response({'version': version, 'url': get_url(version)},
+                        headers={'Cache-Control': 'no-cache'})
+
+
+class SyncView(APIView):
+    """Recipes, tags and ingredients changed or deleted since ?cursor=.
+
+    Start without a cursor and repeat with the returned one while
+    has_more is true, keep the last cursor for the next sync. Recipes
+    carry no flags of the viewer, an authenticated user gets `lists`
+    with favorite, cart and followed ids whenever they change.
+    """
+    permission_classes = (permissions.AllowAny,)
+    renderer_classes = (FastJSONRenderer, BrowsableAPIRenderer)
+
+    def get(self, request):
+        options = settings.SYNC
+        try:
+            limit = int(request.query_params.get(
+                'limit', options['PAGE_SIZE']))
+        except ValueError:
+            raise ValidationError({'limit': 'limit should be an int.'})
+        limit = max(1, min(limit, options['MAX_PAGE_SIZE']))
+        now = timezone.now()
+        # Rows committed late may carry a slightly older timestamp, leave
+        # the last seconds for the next request so none are skipped.
+        until = now - timedelta(seconds=options['SETTLE_SECONDS'])
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            positions = decode_cursor(cursor)
+            expires = now - timedelta(days=options['TOMBSTONE_DAYS'])
+            if positions.get('synced_at', now) < expires:
+                return Response(
+                    {'errors': 'Cursor has expired, start a full sync.'},
+                    status=status.HTTP_410_GONE)
+        else:
+            # A new client has nothing deleted up to where the updates
+            # stop, later deletions come in the next pages.
+            positions = {'deleted': (until, 0)}
+        data, positions = get_changes(
+            positions, until, limit, request, SparseFields(request))
+        positions['synced_at'] = now
+        data['cursor'] = encode_cursor(positions)
+        return Response(data)
@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class EventsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'events'
+    verbose_name = 'События'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        autodiscover_modules('event_handlers')
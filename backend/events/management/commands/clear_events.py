@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from events.models import OutboxEvent
+
+
+class Command(BaseCommand):
+    help = ('Delete events delivered or given up on more than '
+            'EVENTS_RETENTION_DAYS ago')
+
+    def handle(self, *args, **options):
+        events = settings.EVENTS
+        before = timezone.now() - timedelta(days=events['RETENTION_DAYS'])
+        # Events out of attempts are never delivered, available_at is
+        # set just after their last failure.
+        deleted, _ = OutboxEvent.objects.filter(
+            Q(processed_at__lt=before)
+            | Q(processed_at__isnull=True,
+                attempts__gte=events['MAX_ATTEMPTS'],
+                available_at__lt=before)).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} events'))
@@ -0,0 +1,57 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from events.models import OutboxEvent
+from events.outbox import dispatch_batch
+
+
+class Command(BaseCommand):
+    help = 'Deliver outbox events to the registered handlers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when no events are pending.')
+        parser.add_argument('--stats-interval', type=float, default=60,
+                            help='Seconds between throughput reports.')
+
+    def handle(self, *args, **options):
+        total = {'delivered': 0, 'failed': 0}
+        window = {'delivered': 0, 'failed': 0, 'batches': 0}
+        started = reported = time.monotonic()
+        while True:
+            delivered, failed = dispatch_batch()
+            window['delivered'] += delivered
+            window['failed'] += failed
+            window['batches'] += 1
+            now = time.monotonic()
+            if now - reported >= options['stats_interval']:
+                self.report(window, now - reported)
+                for key in total:
+                    total[key] += window[key]
+                window = dict.fromkeys(window, 0)
+                reported = now
+            if delivered + failed:
+                continue
+            if options['once']:
+                break
+            time.sleep(settings.EVENTS['POLL_SECONDS'])
+        for key in total:
+            total[key] += window[key]
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Delivered {total["delivered"]} events, '
+            f'{total["failed"]} failed, '
+            f'{total["delivered"] / elapsed:.1f} events/s'))
+
+    def report(self, window, elapsed):
+        oldest = OutboxEvent.objects.filter(
+            processed_at__isnull=True).order_by('id').values_list(
+            'created_at', flat=True).first()
+        lag = (timezone.now() - oldest).total_seconds() if oldest else 0
+        self.stdout.write(
+            f'{window["delivered"] / elapsed:.1f} events/s, '
+            f'{window["delivered"]} delivered, {window["failed"]} failed '
+            f'in {window["batches"]} batches, lag {lag:.1f}s')
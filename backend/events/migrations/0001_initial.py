@@ -0,0 +1,34 @@
+# Generated by Django 5.0.2 on 2026-10-19 19:44
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic', models.CharField(max_length=100, verbose_name='Тема')),
+                ('payload', models.JSONField(verbose_name='Данные')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Доступно для доставки')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток доставки')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('processed_at', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Дата доставки')),
+            ],
+            options={
+                'verbose_name': 'Событие',
+                'verbose_name_plural': 'События',
+                'ordering': ('id',),
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['available_at', 'id'], name='outbox_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class OutboxEvent(models.Model):
+    """Change of a model, written in the transaction of the change."""
+    topic = models.CharField(
+        max_length=100,
+        verbose_name='Тема',
+    )
+    payload = models.JSONField(
+        verbose_name='Данные',
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата создания',
+    )
+    available_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Доступно для доставки',
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Попыток доставки',
+    )
+    last_error = models.TextField(
+        blank=True,
+        verbose_name='Последняя ошибка',
+    )
+    processed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        db_index=True,
+        verbose_name='Дата доставки',
+    )
+
+    class Meta:
+        ordering = ('id',)
+        verbose_name = 'Событие'
+        verbose_name_plural = 'События'
+        indexes = [models.Index(fields=('available_at', 'id'),
+                                condition=Q(processed_at__isnull=True),
+                                name='outbox_pending_idx')]
+
+    def __str__(self):
+        return f'{self.topic} {self.payload}'
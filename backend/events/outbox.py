@@ -0,0 +1,74 @@
+from datetime import timedelta
+from fnmatch import fnmatch
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxEvent
+
+_handlers = []
+
+
+def emit(model, action, payloads):
+    """Write '<model name>.<action>' events, one per payload.
+
+    Call it inside the transaction of the change, so an event is saved
+    exactly when the change is committed.
+    """
+    topic = f'{model._meta.model_name}.{action}'
+    OutboxEvent.objects.bulk_create(
+        [OutboxEvent(topic=topic, payload=payload) for payload in payloads])
+
+
+def handles(*patterns):
+    """Register a handler for topics matching the patterns, e.g. 'recipe.*'.
+
+    Handlers get the OutboxEvent and must be idempotent: an event is
+    delivered again when any of its handlers fails.
+    """
+
+    def decorator(handler):
+        _handlers.append((patterns, handler))
+        return handler
+    return decorator
+
+
+def get_handlers(topic):
+    return [handler for patterns, handler in _handlers
+            if any(fnmatch(topic, pattern) for pattern in patterns)]
+
+
+def dispatch_batch():
+    """Deliver one batch of pending events, return (delivered, failed).
+
+    Rows are locked with SKIP LOCKED, so several dispatchers share
+    the work without delivering an event twice at the same time.
+    """
+    options = settings.EVENTS
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(OutboxEvent.objects.select_for_update(
+            skip_locked=True).filter(
+            processed_at__isnull=True, available_at__lte=now,
+            attempts__lt=options['MAX_ATTEMPTS']).order_by(
+            'id')[:options['BATCH_SIZE']])
+        delivered, failed = [], []
+        for event in events:
+            try:
+                with transaction.atomic():
+                    for handler in get_handlers(event.topic):
+                        handler(event)
+            except Exception as error:
+                event.attempts += 1
+                event.last_error = repr(error)
+                event.available_at = now + timedelta(
+                    seconds=options['RETRY_SECONDS'] * 2 ** event.attempts)
+                failed.append(event)
+            else:
+                event.processed_at = now
+                delivered.append(event)
+        OutboxEvent.objects.bulk_update(delivered, ('processed_at',))
+        OutboxEvent.objects.bulk_update(
+            failed, ('attempts', 'last_error', 'available_at'))
+    return len(delivered), len(failed)
@@ -0,0 +1,34 @@
+from django.db.models.signals import post_delete, post_save
+
+from recipes.models import Favorite, IngredientRecipe, Recipe, ShoppingList
+from users.models import Subscribe
+
+from .outbox import emit
+
+EVENT_FIELDS = {
+    Recipe: ('id', 'author_id'),
+    IngredientRecipe: ('recipe_id', 'ingredient_id'),
+    Favorite: ('user_id', 'recipe_id'),
+    ShoppingList: ('user_id', 'recipe_id'),
+    Subscribe: ('user_id', 'author_id'),
+}
+
+
+def get_payload(instance):
+    return {name: getattr(instance, name)
+            for name in EVENT_FIELDS[type(instance)]}
+
+
+def emit_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        emit(sender, 'created' if created else 'updated',
+             [get_payload(instance)])
+
+
+def emit_deleted(sender, instance, **kwargs):
+    emit(sender, 'deleted', [get_payload(instance)])
+
+
+for model in EVENT_FIELDS:
+    post_save.connect(emit_saved, sender=model)
+    post_delete.connect(emit_deleted, sender=model)
@@ -0,0 +1,64 @@
+import itertools
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import DatabaseError
+
+_read_from_replica = ContextVar('read_from_replica', default=False)
+
+
+def set_read_from_replica(value):
+    """Allow or forbid replica reads for the current request."""
+    return _read_from_replica.set(value)
+
+
+def reset_read_from_replica(token):
+    _read_from_replica.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Send reads of safe requests to replicas, everything else to primary.
+
+    A replica that fails to connect is skipped for
+    DATABASE_REPLICA_RETRY_SECONDS, reads fall back to the primary
+    while no replica is available. A working replica is checked again
+    after DATABASE_REPLICA_CHECK_SECONDS, not on every read.
+    """
+
+    def __init__(self):
+        self._counter = itertools.count()
+        self._health = {}
+
+    def _is_available(self, alias):
+        now = time.monotonic()
+        available, expires = self._health.get(alias, (None, 0))
+        if expires > now:
+            return available
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            self._health[alias] = (
+                False, now + settings.DATABASE_REPLICA_RETRY_SECONDS)
+            return False
+        self._health[alias] = (
+            True, now + settings.DATABASE_REPLICA_CHECK_SECONDS)
+        return True
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or not _read_from_replica.get():
+            return DEFAULT_DB_ALIAS
+        start = next(self._counter)
+        for offset in range(len(replicas)):
+            alias = replicas[(start + offset) % len(replicas)]
+            if self._is_available(alias):
+                return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
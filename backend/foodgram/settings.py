@@ -1,6 +1,8 @@
 import os
+from datetime import timedelta
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 # Загрузка переменных окружения из файла .env
@@ -25,18 +27,23 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
     'rest_framework.authtoken',
     'djoser',
     'django_filters',
     'api',
+    'events',
+    'jobs',
     'recipes',
     'users',
 ]
 
 
 MIDDLEWARE = [
+    'api.middleware.QueryMetricsMiddleware',
+    'api.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -44,6 +51,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -81,6 +89,44 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения, через запятую: DB_REPLICA_HOSTS=replica1,replica2
+for index, host in enumerate(
+        filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(','))):
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['foodgram.db_routers.PrimaryReplicaRouter']
+DATABASE_REPLICA_PIN_SECONDS = int(os.getenv('DB_REPLICA_PIN_SECONDS', 5))
+DATABASE_REPLICA_RETRY_SECONDS = int(
+    os.getenv('DB_REPLICA_RETRY_SECONDS', 30))
+# Как долго реплика считается доступной без повторной проверки соединения
+DATABASE_REPLICA_CHECK_SECONDS = int(
+    os.getenv('DB_REPLICA_CHECK_SECONDS', 5))
+
+QUERY_METRICS_ENABLED = (
+    os.getenv('QUERY_METRICS_ENABLED', 'False').lower() == 'true')
+
+# Сжатие ответов API: brotli (если установлен) или gzip
+COMPRESSION = {
+    'ENABLED': os.getenv('COMPRESSION_ENABLED', 'True').lower() == 'true',
+    'MIN_SIZE': int(os.getenv('COMPRESSION_MIN_SIZE', 1024)),
+    'GZIP_LEVEL': int(os.getenv('COMPRESSION_GZIP_LEVEL', 6)),
+    'BROTLI_QUALITY': int(os.getenv('COMPRESSION_BROTLI_QUALITY', 5)),
+    'CONTENT_TYPES': ('application/json', 'text/plain'),
+}
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -97,12 +143,45 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Хэширование паролей: scrypt (по умолчанию) или argon2 (нужен argon2-cffi).
+# Хэши других алгоритмов и с прежними параметрами пересчитываются при входе.
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'scrypt')
+PASSWORD_HASHERS = {
+    'scrypt': 'users.hashers.ScryptPasswordHasher',
+    'argon2': 'users.hashers.Argon2PasswordHasher',
+    'pbkdf2': 'users.hashers.PBKDF2PasswordHasher',
+}
+if PASSWORD_HASHER not in PASSWORD_HASHERS:
+    raise ImproperlyConfigured(
+        f'Unknown PASSWORD_HASHER {PASSWORD_HASHER!r}, use one of: '
+        f'{", ".join(PASSWORD_HASHERS)}.')
+PASSWORD_HASHERS = [PASSWORD_HASHERS.pop(PASSWORD_HASHER),
+                    *PASSWORD_HASHERS.values()]
+
+PASSWORD_HASHING = {
+    # Одновременных вычислений хэша в процессе; запросы API ждут слот
+    # TIMEOUT секунд и получают 429, админка и команды ждут без ограничения
+    'CONCURRENCY': int(os.getenv(
+        'PASSWORD_HASHING_CONCURRENCY', max(1, (os.cpu_count() or 2) // 2))),
+    'TIMEOUT': int(os.getenv('PASSWORD_HASHING_TIMEOUT', 5)),
+    'SCRYPT': {
+        'WORK_FACTOR': int(os.getenv('PASSWORD_SCRYPT_WORK_FACTOR', 2 ** 14)),
+        'BLOCK_SIZE': int(os.getenv('PASSWORD_SCRYPT_BLOCK_SIZE', 8)),
+        'PARALLELISM': int(os.getenv('PASSWORD_SCRYPT_PARALLELISM', 1)),
+    },
+    'ARGON2': {
+        'TIME_COST': int(os.getenv('PASSWORD_ARGON2_TIME_COST', 2)),
+        'MEMORY_COST': int(os.getenv('PASSWORD_ARGON2_MEMORY_COST', 19456)),
+        'PARALLELISM': int(os.getenv('PASSWORD_ARGON2_PARALLELISM', 1)),
+    },
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny'
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
@@ -110,6 +189,145 @@ REST_FRAMEWORK = {
         'django_filters.rest_framework.DjangoFilterBackend',
     ],
     'SEARCH_PARAM': 'name',
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.UserTokenBucketThrottle',
+        'api.throttling.IPTokenBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'favorite': os.getenv('THROTTLE_FAVORITE', '60/min'),
+        'favorite_ip': os.getenv('THROTTLE_FAVORITE_IP', '300/min'),
+        'shopping_cart': os.getenv('THROTTLE_SHOPPING_CART', '60/min'),
+        'shopping_cart_ip': os.getenv('THROTTLE_SHOPPING_CART_IP', '300/min'),
+        'subscribe': os.getenv('THROTTLE_SUBSCRIBE', '30/min'),
+        'subscribe_ip': os.getenv('THROTTLE_SUBSCRIBE_IP', '150/min'),
+        'recipe_create': os.getenv('THROTTLE_RECIPE_CREATE', '10/min'),
+        'recipe_create_ip': os.getenv('THROTTLE_RECIPE_CREATE_IP', '50/min'),
+        'login_ip': os.getenv('THROTTLE_LOGIN_IP', '20/min'),
+        'signup_ip': os.getenv('THROTTLE_SIGNUP_IP', '10/min'),
+        'meal_plan': os.getenv('THROTTLE_MEAL_PLAN', '10/min'),
+    },
+}
+
+# Кэш токенов авторизации: алиас из CACHES, общий для воркеров (Redis при
+# заданном REDIS_URL), чтобы выход и смена пароля доходили до всех воркеров;
+# 'local' — LRU в памяти процесса, только для одного воркера
+TOKEN_AUTH_CACHE = {
+    'CACHE': os.getenv('TOKEN_AUTH_CACHE', 'default'),
+    'MAX_SIZE': 10000,
+    'TTL': int(os.getenv('TOKEN_AUTH_CACHE_TTL', 60)),
+}
+
+# Кэш публичных профилей пользователей и их подписок (алиас из CACHES)
+PROFILE_CACHE = {
+    'CACHE': os.getenv('PROFILE_CACHE', 'default'),
+    'TTL': int(os.getenv('PROFILE_CACHE_TTL', 300)),
+}
+
+# Кэш страниц рецептов: сколько секунд запись свежая, сколько еще отдается
+# устаревшей, пока один воркер ее пересчитывает, и сколько рецептов
+# прогревает warm_recipe_details
+RECIPE_DETAIL_CACHE = {
+    'CACHE': os.getenv('RECIPE_DETAIL_CACHE', 'default'),
+    'TTL': int(os.getenv('RECIPE_DETAIL_CACHE_TTL', 300)),
+    'STALE_SECONDS': int(os.getenv('RECIPE_DETAIL_STALE_SECONDS', 3600)),
+    'LOCK_SECONDS': 10,
+    'WAIT_MS': 200,
+    'BATCH_SIZE': 200,
+    'WARM_TOP': int(os.getenv('RECIPE_DETAIL_WARM_TOP', 1000)),
+}
+
+# Максимум рецептов в одном пакетном запросе к избранному и корзине
+BATCH_MAX_SIZE = 100
+
+# Инкрементальная синхронизация каталога (/api/sync/)
+SYNC = {
+    'PAGE_SIZE': 500,
+    'MAX_PAGE_SIZE': 2000,
+    # Изменения последних секунд отдаются в следующем запросе
+    'SETTLE_SECONDS': int(os.getenv('SYNC_SETTLE_SECONDS', 5)),
+    # Сколько хранятся записи об удалении, более старые курсоры истекают
+    'TOMBSTONE_DAYS': int(os.getenv('SYNC_TOMBSTONE_DAYS', 30)),
+}
+
+# Доставка событий из outbox: python manage.py dispatch_events
+EVENTS = {
+    'BATCH_SIZE': int(os.getenv('EVENTS_BATCH_SIZE', 100)),
+    'POLL_SECONDS': 1,
+    # Повтор через RETRY_SECONDS * 2 ** попытка
+    'RETRY_SECONDS': 5,
+    'MAX_ATTEMPTS': 10,
+    'RETENTION_DAYS': int(os.getenv('EVENTS_RETENTION_DAYS', 7)),
+}
+
+# Фоновые задачи: очередь -> сколько задач одновременно выполняет
+# один процесс run_jobs, например JOB_QUEUES=default:4,images:2
+JOBS = {
+    'QUEUES': {
+        queue: int(limit) for queue, limit in (
+            item.split(':') for item in os.getenv(
+                'JOB_QUEUES', 'default:2,images:1').split(','))},
+    'POLL_SECONDS': 1,
+    # Повтор через RETRY_SECONDS * 2 ** (попытка - 1)
+    'RETRY_SECONDS': 10,
+    # Задача, выполняемая дольше, считается брошенной и берётся снова
+    'TIMEOUT_SECONDS': int(os.getenv('JOBS_TIMEOUT_SECONDS', 600)),
+    'RETENTION_DAYS': int(os.getenv('JOBS_RETENTION_DAYS', 7)),
+}
+
+# План питания: время поиска на запрос, сколько рецептов с наименьшим
+# числом ингредиентов рассматривать для каждого тега, максимум дней;
+# каталог рецептов собирает фоновая задача и хранит кэш CACHE
+MEAL_PLAN = {
+    'CACHE': os.getenv('MEAL_PLAN_CACHE', 'default'),
+    'TIME_BUDGET_MS': int(os.getenv('MEAL_PLAN_TIME_BUDGET_MS', 200)),
+    'CANDIDATES': 2000,
+    'MAX_DAYS': 14,
+}
+
+# Похожие рецепты: сколько хранить на рецепт, вес общих добавлений в
+# избранное против общих ингредиентов, ингредиенты и пользователи чаще
+# MAX_POSTING рецептов (соль) не используются для поиска кандидатов
+SIMILAR_RECIPES = {
+    'NEIGHBORS': 20,
+    'FAVORITES_WEIGHT': float(os.getenv('SIMILAR_FAVORITES_WEIGHT', 0.3)),
+    'MAX_POSTING': 5000,
+    'BATCH_SIZE': 1000,
+}
+
+# Выше этого числа строк админка показывает оценку из статистики
+# PostgreSQL вместо точного COUNT(*)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 10000
+
+# Импорт и экспорт в админке: строк в пакете записи, строк в выборке
+# экспорта, сколько ошибок показывать
+IMPORT_EXPORT = {
+    'BATCH_SIZE': 1000,
+    'CHUNK_SIZE': 2000,
+    'MAX_ERRORS': 100,
+}
+
+# Размер большей стороны и качество JPEG картинок рецептов
+RECIPE_IMAGE_MAX_SIZE = int(os.getenv('RECIPE_IMAGE_MAX_SIZE', 1280))
+RECIPE_IMAGE_QUALITY = 85
+
+# Хранилище корзин токенов: в памяти процесса или в общем кэше
+THROTTLE_BUCKET_STORE = os.getenv(
+    'THROTTLE_BUCKET_STORE', 'api.throttling.LocMemBucketStore')
+THROTTLE_CACHE = 'default'
+
+# JWT без обращений к базе при проверке access-токена
+JWT_AUTH_ENABLED = os.getenv('JWT_AUTH_ENABLED', 'False').lower() == 'true'
+if JWT_AUTH_ENABLED:
+    REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES'].append(
+        'api.authentication.StatelessJWTAuthentication')
+
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(
+        minutes=int(os.getenv('JWT_ACCESS_MINUTES', 5))),
+    'REFRESH_TOKEN_LIFETIME': timedelta(
+        days=int(os.getenv('JWT_REFRESH_DAYS', 7))),
+    'AUTH_HEADER_TYPES': ('Bearer',),
+    'UPDATE_LAST_LOGIN': False,
 }
 
 DJOSER = {
@@ -143,6 +361,14 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'collected_static'
 
+# Статический пакет тегов и ингредиентов: каталог, который раздает nginx,
+# его URL и сколько последних версий хранить
+CATALOGUE_BUNDLE = {
+    'ROOT': os.getenv('CATALOGUE_BUNDLE_ROOT', STATIC_ROOT / 'catalogue'),
+    'URL': STATIC_URL + 'catalogue/',
+    'KEEP': 3,
+}
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = '/media/'
 
@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from jobs.models import Job
+
+
+class Command(BaseCommand):
+    help = 'Delete jobs finished more than JOBS_RETENTION_DAYS ago'
+
+    def handle(self, *args, **options):
+        deleted, _ = Job.objects.filter(
+            finished_at__lt=timezone.now() - timedelta(
+                days=settings.JOBS['RETENTION_DAYS'])).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} jobs'))
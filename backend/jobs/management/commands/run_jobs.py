@@ -0,0 +1,75 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+
+from jobs.models import Job
+from jobs.queue import claim, run
+
+
+class Command(BaseCommand):
+    help = ('Run queued jobs, JOBS["QUEUES"] sets how many run '
+            'at once in each queue')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', action='append', dest='queues',
+                            help='Queue to serve, all by default.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when no jobs are due.')
+
+    def handle(self, *args, **options):
+        limits = settings.JOBS['QUEUES']
+        queues = options['queues'] or list(limits)
+        unknown = set(queues) - set(limits)
+        if unknown:
+            raise CommandError(f'Unknown queues: {", ".join(unknown)}')
+        self.stop = threading.Event()
+        self.counts = dict.fromkeys(Job.Status, 0)
+        self.lock = threading.Lock()
+        threads = [
+            threading.Thread(target=self.work, args=(queue, options['once']),
+                             daemon=True)
+            for queue in queues for _ in range(limits[queue])]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            # Running jobs finish, the stale timeout covers the rest.
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Done {self.counts[Job.Status.DONE]} jobs, '
+            f'{self.counts[Job.Status.PENDING]} to retry, '
+            f'{self.counts[Job.Status.FAILED]} failed, '
+            f'{self.counts[Job.Status.DONE] / elapsed:.1f} jobs/s'))
+
+    def work(self, queue, once):
+        try:
+            while not self.stop.is_set():
+                try:
+                    job = claim(queue)
+                except DatabaseError as error:
+                    # The thread keeps serving the queue after the
+                    # database comes back.
+                    self.stderr.write(f'{queue}: {error}')
+                    connection.close()
+                    self.stop.wait(settings.JOBS['POLL_SECONDS'])
+                    continue
+                if job is None:
+                    if once:
+                        break
+                    self.stop.wait(settings.JOBS['POLL_SECONDS'])
+                    continue
+                status = run(job)
+                with self.lock:
+                    self.counts[status] += 1
+        finally:
+            connection.close()
@@ -0,0 +1,71 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """Call of a registered task, run by the run_jobs worker."""
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Ожидает'
+        RUNNING = 'running', 'Выполняется'
+        DONE = 'done', 'Выполнена'
+        FAILED = 'failed', 'Ошибка'
+
+    queue = models.CharField(
+        max_length=50,
+        verbose_name='Очередь',
+    )
+    task = models.CharField(
+        max_length=200,
+        verbose_name='Задача',
+    )
+    kwargs = models.JSONField(
+        default=dict,
+        verbose_name='Аргументы',
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=Status.choices,
+        default=Status.PENDING,
+        verbose_name='Статус',
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Попыток',
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        default=5,
+        verbose_name='Максимум попыток',
+    )
+    run_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Запустить после',
+    )
+    locked_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Взята в работу',
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Завершена',
+    )
+    last_error = models.TextField(
+        blank=True,
+        verbose_name='Последняя ошибка',
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Создана',
+    )
+
+    class Meta:
+        ordering = ('-id',)
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [models.Index(fields=('queue', 'status', 'run_at'),
+                                name='job_queue_status_run_at_idx')]
+
+    def __str__(self):
+        return f'{self.task} ({self.status})'
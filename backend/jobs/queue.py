@@ -0,0 +1,85 @@
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Job
+
+_tasks = {}
+
+
+def task(queue='default', max_attempts=5, unique=False):
+    """Register a function as a task, `func.delay(**kwargs)` enqueues it.
+
+    Tasks run at least once and get only JSON serializable kwargs.
+    A unique task is not enqueued again while the same call is pending.
+    """
+
+    def decorator(func):
+        name = f'{func.__module__}.{func.__name__}'
+        _tasks[name] = func
+        func.delay = lambda **kwargs: enqueue(
+            name, kwargs, queue=queue, max_attempts=max_attempts,
+            unique=unique)
+        return func
+    return decorator
+
+
+def enqueue(name, kwargs, queue='default', max_attempts=5, run_at=None,
+            unique=False):
+    """Add a job. Inside a transaction it appears only on commit."""
+    if unique:
+        pending = Job.objects.filter(
+            task=name, kwargs=kwargs, status=Job.Status.PENDING).first()
+        if pending is not None:
+            return pending
+    return Job.objects.create(
+        task=name, kwargs=kwargs, queue=queue, max_attempts=max_attempts,
+        run_at=run_at or timezone.now())
+
+
+def claim(queue):
+    """Take the next due job of the queue or None.
+
+    SKIP LOCKED lets concurrent workers take different jobs. Jobs left
+    running longer than TIMEOUT_SECONDS by a dead worker are taken again.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.JOBS['TIMEOUT_SECONDS'])
+    with transaction.atomic():
+        job = Job.objects.select_for_update(skip_locked=True).filter(
+            Q(status=Job.Status.PENDING, run_at__lte=now)
+            | Q(status=Job.Status.RUNNING, locked_at__lt=stale),
+            queue=queue).order_by('run_at', 'id').first()
+        if job is None:
+            return None
+        job.status = Job.Status.RUNNING
+        job.locked_at = now
+        job.attempts += 1
+        job.save(update_fields=('status', 'locked_at', 'attempts'))
+    return job
+
+
+def run(job):
+    """Run a claimed job, retry it later with backoff when it fails."""
+    try:
+        _tasks[job.task](**job.kwargs)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = Job.Status.FAILED
+            job.finished_at = timezone.now()
+        else:
+            job.status = Job.Status.PENDING
+            job.run_at = timezone.now() + timedelta(
+                seconds=settings.JOBS['RETRY_SECONDS']
+                * 2 ** (job.attempts - 1))
+    else:
+        job.status = Job.Status.DONE
+        job.finished_at = timezone.now()
+    job.save(update_fields=(
+        'status', 'finished_at', 'run_at', 'last_error'))
+    return job.status
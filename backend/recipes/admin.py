@@ -1,26 +1,197 @@
+import csv
+
+from django import forms
+from django.conf import settings
 from django.contrib import admin
-from django.db.models import Count
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils.functional import cached_property
+
+from .models import (ExclusionProfile, Favorite, Ingredient, IngredientRecipe,
+                     Recipe, ShoppingList, Tag)
+from .transfer import export_response, import_rows, read_rows
+
+
+class EstimatedCountPaginator(Paginator):
+    """Take the row count of an unfiltered changelist from statistics.
+
+    COUNT(*) reads the whole table on PostgreSQL, the estimate from
+    pg_class is used when it is above ADMIN_ESTIMATED_COUNT_THRESHOLD.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                    [queryset.model._meta.db_table])
+                estimate = int(cursor.fetchone()[0])
+            if estimate > settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class AutocompleteFilter(admin.SimpleListFilter):
+    """Filter by a related object picked with the admin autocomplete.
+
+    parameter_name is the relation field, the related model admin
+    needs search_fields.
+    """
+    template = 'admin/recipes/autocomplete_filter.html'
+
+    def __init__(self, request, params, model, model_admin):
+        super().__init__(request, params, model, model_admin)
+        field = model._meta.get_field(self.parameter_name)
+        widget = AutocompleteSelect(field, model_admin.admin_site)
+        form_field = forms.ModelChoiceField(
+            queryset=field.related_model.objects.all(), widget=widget,
+            required=False)
+        try:
+            form_field.clean(self.value())
+        except ValidationError as error:
+            raise IncorrectLookupParameters(error)
+        self.widget = form_field.widget.render(
+            self.parameter_name, self.value(),
+            attrs={'id': f'filter_{self.parameter_name}',
+                   'style': 'width: 90%'})
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(
+                remove=[self.parameter_name]),
+            'display': 'Все',
+        }
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.parameter_name: self.value()})
+        return queryset
+
+
+class AuthorFilter(AutocompleteFilter):
+    title = 'автору'
+    parameter_name = 'author'
+
+
+class TagFilter(AutocompleteFilter):
+    title = 'тегу'
+    parameter_name = 'tags'
+
 
-from .models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                     ShoppingList, Tag)
+class ImportForm(forms.Form):
+    file = forms.FileField(label='Файл CSV или JSON')
+
+
+class ExportMixin:
+    """Actions streaming the selected rows as CSV or JSON."""
+    actions = ('export_csv', 'export_json')
+    export_fields = ()
+
+    def export_rows(self, queryset):
+        return queryset.values(*self.export_fields).iterator(
+            chunk_size=settings.IMPORT_EXPORT['CHUNK_SIZE'])
+
+    def export(self, queryset, export_format):
+        return export_response(
+            self.export_rows(queryset), self.export_fields, export_format,
+            self.opts.model_name)
+
+    @admin.action(description='Экспортировать в CSV')
+    def export_csv(self, request, queryset):
+        return self.export(queryset, 'csv')
+
+    @admin.action(description='Экспортировать в JSON')
+    def export_json(self, request, queryset):
+        return self.export(queryset, 'json')
+
+
+class ImportMixin:
+    """Import view creating or updating rows matched by import_key."""
+    change_list_template = 'admin/recipes/import_change_list.html'
+    import_fields = ()
+    import_key = ()
+    recipes_lookup = None
+
+    def get_urls(self):
+        return [path(
+            'import/', self.admin_site.admin_view(self.import_view),
+            name=f'{self.opts.app_label}_{self.opts.model_name}_import',
+        )] + super().get_urls()
+
+    def import_view(self, request):
+        if not (self.has_add_permission(request)
+                and self.has_change_permission(request)):
+            raise PermissionDenied
+        form = ImportForm(request.POST or None, request.FILES or None)
+        result = None
+        if form.is_valid():
+            file = form.cleaned_data['file']
+            try:
+                result = import_rows(
+                    self.model, read_rows(file, file.name),
+                    self.import_fields, self.import_key, self.recipes_lookup)
+            except ValidationError as error:
+                form.add_error('file', error)
+            except (ValueError, csv.Error) as error:
+                form.add_error('file', str(error))
+            else:
+                result['error_count'] = len(result['errors'])
+                result['errors'] = sorted(result['errors'])[
+                    :settings.IMPORT_EXPORT['MAX_ERRORS']]
+        return TemplateResponse(request, 'admin/recipes/import.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.opts,
+            'title': f'Импорт: {self.opts.verbose_name_plural}',
+            'form': form,
+            'fields': self.import_fields,
+            'result': result,
+        })
 
 
 class RecipeIngrediendsInLine(admin.TabularInline):
     model = IngredientRecipe
     extra = 3
     min_num = 1
+    autocomplete_fields = ('ingredient',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('ingredient')
 
 
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(ExportMixin, admin.ModelAdmin):
     list_display = ('name', 'author', 'ingredients_list', 'tags_list',
                     'favorites_count')
-    list_filter = ('author', 'name', 'tags')
+    list_filter = (AuthorFilter, TagFilter)
+    list_select_related = ('author',)
+    search_fields = ('name',)
+    autocomplete_fields = ('author',)
     inlines = (RecipeIngrediendsInLine,)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+    export_fields = ('id', 'name', 'author', 'text', 'cooking_time',
+                     'image', 'tags', 'ingredients')
 
     @admin.display(description='Список ингредиентов')
     def ingredients_list(self, obj):
-        return [i.ingredient for i in
-                obj.recipe_ingredients.all().select_related('ingredient')]
+        return [i.ingredient for i in obj.recipe_ingredients.all()]
 
     @admin.display(description='Список тэгов')
     def tags_list(self, obj):
@@ -32,22 +203,71 @@ class RecipeAdmin(admin.ModelAdmin):
 
     readonly_fields = ('favorites_count',)
 
+    def export_rows(self, queryset):
+        queryset = queryset.select_related('author').prefetch_related(
+            'tags', 'recipe_ingredients__ingredient')
+        for recipe in queryset.iterator(
+                chunk_size=settings.IMPORT_EXPORT['CHUNK_SIZE']):
+            yield {
+                'id': recipe.id,
+                'name': recipe.name,
+                'author': recipe.author.email,
+                'text': recipe.text,
+                'cooking_time': recipe.cooking_time,
+                'image': recipe.image.name,
+                'tags': [tag.slug for tag in recipe.tags.all()],
+                'ingredients': [
+                    {'name': item.ingredient.name,
+                     'measurement_unit': item.ingredient.measurement_unit,
+                     'amount': item.amount}
+                    for item in recipe.recipe_ingredients.all()],
+            }
+
+    @property
+    def media(self):
+        # Scripts of the filter widgets, the changelist adds only these.
+        return super().media + AutocompleteSelect(
+            Recipe._meta.get_field('author'), self.admin_site).media
+
     def get_queryset(self, request):
         queryset = super().get_queryset(request)
-        queryset = queryset.annotate(
-            favorite_recipe_count=Count(
-                'favorite_recipe'))
-        return queryset
+        # A subquery is computed only for the rows of the page, unlike
+        # a COUNT over a join with all favorites.
+        favorites = Favorite.objects.filter(
+            recipe=OuterRef('pk')).order_by().values('recipe').annotate(
+            count=Count('id')).values('count')
+        return queryset.annotate(
+            favorite_recipe_count=Coalesce(Subquery(favorites), 0)
+        ).prefetch_related(
+            'tags',
+            Prefetch('recipe_ingredients',
+                     queryset=IngredientRecipe.objects.select_related(
+                         'ingredient')))
 
 
-class TagAdmin(admin.ModelAdmin):
+class TagAdmin(ImportMixin, ExportMixin, admin.ModelAdmin):
     list_display = ('name', 'color', 'slug')
     search_fields = ('name',)
+    export_fields = ('id', 'name', 'color', 'slug')
+    import_fields = ('name', 'color', 'slug')
+    import_key = ('slug',)
+    recipes_lookup = 'tags'
 
 
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(ImportMixin, ExportMixin, admin.ModelAdmin):
     list_display = ('name', 'measurement_unit')
     search_fields = ('name',)
+    export_fields = ('id', 'name', 'measurement_unit')
+    import_fields = ('name', 'measurement_unit')
+    import_key = ('name', 'measurement_unit')
+    recipes_lookup = 'ingredients'
+
+
+class ExclusionProfileAdmin(admin.ModelAdmin):
+    list_display = ('name', 'user')
+    list_select_related = ('user',)
+    search_fields = ('name',)
+    autocomplete_fields = ('user', 'ingredients')
 
 
 admin.site.register(Recipe, RecipeAdmin)
@@ -56,3 +276,4 @@ admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(IngredientRecipe)
 admin.site.register(Favorite)
 admin.site.register(ShoppingList)
+admin.site.register(ExclusionProfile, ExclusionProfileAdmin)
@@ -0,0 +1,89 @@
+"""Tags and ingredients as a static JSON bundle.
+
+The bundle is named by the hash of its content, so nginx serves it
+with immutable caching and clients download it again only when the
+catalogue changes. The `current` file in the bundle directory holds
+the latest version.
+"""
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+from .models import Ingredient, Tag
+
+CURRENT = 'current'
+
+_current = {'mtime': None, 'version': None}
+
+
+def get_root():
+    return Path(settings.CATALOGUE_BUNDLE['ROOT'])
+
+
+def get_url(version):
+    return f'{settings.CATALOGUE_BUNDLE["URL"]}{version}.json'
+
+
+def build_content():
+    """The bundle as bytes, same fields as the tags and ingredients API."""
+    data = {
+        'tags': list(Tag.objects.order_by('id').values(
+            'id', 'name', 'color', 'slug')),
+        'ingredients': list(Ingredient.objects.order_by('id').values(
+            'id', 'measurement_unit', 'name')),
+    }
+    return json.dumps(data, ensure_ascii=False,
+                      separators=(',', ':')).encode()
+
+
+def write_file(path, content):
+    """Replace the file at once, readers never see it half written."""
+    with tempfile.NamedTemporaryFile(
+            dir=path.parent, prefix='.', delete=False) as file:
+        file.write(content)
+    os.chmod(file.name, 0o644)
+    os.replace(file.name, path)
+
+
+def build_bundle():
+    """Write the bundle unless it is there already, return its version.
+
+    Next to the JSON goes a .json.gz for nginx gzip_static. Bundles
+    other than the KEEP latest are removed, clients still loading an
+    older version have time to finish.
+    """
+    content = build_content()
+    version = hashlib.sha256(content).hexdigest()[:16]
+    root = get_root()
+    root.mkdir(parents=True, exist_ok=True)
+    path = root / f'{version}.json'
+    if not path.exists():
+        write_file(root / f'{version}.json.gz',
+                   gzip.compress(content, compresslevel=9, mtime=0))
+        write_file(path, content)
+    os.utime(path)
+    write_file(root / CURRENT, version.encode())
+    bundles = sorted(root.glob('*.json'), key=lambda bundle: (
+        bundle.stat().st_mtime, bundle.name), reverse=True)
+    for bundle in bundles[settings.CATALOGUE_BUNDLE['KEEP']:]:
+        bundle.unlink(missing_ok=True)
+        bundle.with_suffix('.json.gz').unlink(missing_ok=True)
+    return version
+
+
+def get_version():
+    """Version of the latest bundle or None, read again when it changes."""
+    try:
+        mtime = (get_root() / CURRENT).stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if _current['mtime'] != mtime:
+        _current.update(
+            mtime=mtime,
+            version=(get_root() / CURRENT).read_text().strip() or None)
+    return _current['version']
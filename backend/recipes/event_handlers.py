@@ -0,0 +1,8 @@
+from events.outbox import handles
+
+from .tasks import refresh_similar_recipes
+
+
+@handles('ingredientrecipe.*', 'favorite.*')
+def refresh_similar(event):
+    refresh_similar_recipes.delay(recipe_id=event.payload['recipe_id'])
@@ -0,0 +1,19 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from recipes.catalogue import build_bundle, get_root, get_url
+
+
+class Command(BaseCommand):
+    help = 'Write the static bundle of tags and ingredients'
+
+    def handle(self, *args, **options):
+        version = build_bundle()
+        path = get_root() / f'{version}.json'
+        self.stdout.write(json.dumps({
+            'version': version,
+            'url': get_url(version),
+            'bytes': path.stat().st_size,
+            'gzip_bytes': path.with_suffix('.json.gz').stat().st_size,
+        }, indent=2))
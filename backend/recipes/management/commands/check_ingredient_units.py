@@ -0,0 +1,44 @@
+import csv
+import json
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import Ingredient
+from recipes.units import UNITS, canonical_name, canonical_unit
+
+
+class Command(BaseCommand):
+    help = ('Show how shopping lists merge the ingredients: units without '
+            'a conversion and names that merge into one line')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file',
+                            help='CSV of name,unit rows instead of the '
+                                 'ingredients table, e.g. '
+                                 'data/ingredients.csv')
+
+    def handle(self, *args, **options):
+        if options['file']:
+            with open(options['file'], encoding='utf-8') as file:
+                rows = [tuple(row) for row in csv.reader(file)]
+        else:
+            rows = list(Ingredient.objects.values_list(
+                'name', 'measurement_unit'))
+        units = Counter(unit for _, unit in rows)
+        lines = defaultdict(set)
+        for name, unit in rows:
+            lines[canonical_name(name), canonical_unit(unit)[0]].add(
+                f'{name}, {unit}')
+        self.stdout.write(json.dumps({
+            'ingredients': len(rows),
+            'shopping_list_lines': len(lines),
+            'converted_units': {
+                unit: count for unit, count in units.most_common()
+                if unit in UNITS},
+            'units_without_conversion': {
+                unit: count for unit, count in units.most_common()
+                if unit not in UNITS},
+            'merged': sorted(sorted(names) for names in lines.values()
+                             if len(names) > 1),
+        }, ensure_ascii=False, indent=2))
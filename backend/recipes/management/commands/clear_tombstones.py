@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.models import Tombstone
+
+
+class Command(BaseCommand):
+    help = 'Delete deletion records older than SYNC_TOMBSTONE_DAYS'
+
+    def handle(self, *args, **options):
+        deleted, _ = Tombstone.objects.filter(
+            deleted_at__lt=timezone.now() - timedelta(
+                days=settings.SYNC['TOMBSTONE_DAYS'])).delete()
+        self.stdout.write(
+            self.style.SUCCESS(f'Deleted {deleted} tombstones'))
@@ -0,0 +1,24 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.similarity import compute_all
+
+
+class Command(BaseCommand):
+    help = 'Recompute similar recipes of every recipe'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        recipe_ids = list(Recipe.objects.order_by('id').values_list(
+            'id', flat=True))
+        pairs = compute_all(recipe_ids)
+        elapsed = time.monotonic() - started
+        self.stdout.write(json.dumps({
+            'recipes': len(recipe_ids),
+            'pairs': pairs,
+            'seconds': round(elapsed, 3),
+            'recipes_per_second': round(len(recipe_ids) / elapsed, 1),
+        }, indent=2))
@@ -1,10 +1,12 @@
 import csv
+import json
 import os
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
 from recipes.models import Ingredient
+from recipes.transfer import import_rows
 
 
 class Command(BaseCommand):
@@ -13,12 +15,13 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         csv_file = os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv')
         with open(csv_file, 'r', encoding='utf-8') as file:
-            reader = csv.reader(file)
-            for row in reader:
-                name, measurement_unit = row
-                Ingredient.objects.create(
-                    name=name.strip(),
-                    measurement_unit=measurement_unit.strip()
-                )
+            rows = ({'name': name, 'measurement_unit': measurement_unit}
+                    for name, measurement_unit in csv.reader(file))
+            result = import_rows(Ingredient, rows,
+                                 ('name', 'measurement_unit'),
+                                 ('name', 'measurement_unit'))
+        for line, message in result.pop('errors'):
+            self.stderr.write(f'{line}: {message}')
+        self.stdout.write(json.dumps(result, indent=2))
         self.stdout.write(
             self.style.SUCCESS('Ingredients imported successfully'))
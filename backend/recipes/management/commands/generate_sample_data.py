@@ -0,0 +1,148 @@
+import base64
+import random
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingList, Tag)
+from recipes.signals import store_ingredients
+from users.models import Subscribe, User
+
+SAMPLE_EMAIL_DOMAIN = 'sample.foodgram.local'
+SAMPLE_PASSWORD = 'sample-password'
+SAMPLE_IMAGE = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8Dw'
+    'HwAFBQIAX8jx0gAAAABJRU5ErkJggg==')
+SAMPLE_IMAGE_NAME = 'recipes/images/sample.png'
+
+SCALES = {
+    'small': {'users': 50, 'recipes': 200},
+    'medium': {'users': 1000, 'recipes': 10000},
+    'large': {'users': 10000, 'recipes': 100000},
+}
+BATCH_SIZE = 5000
+
+
+def bulk_create(model, objs, **kwargs):
+    """Insert objects from an iterator without materializing it."""
+    objs = iter(objs)
+    while batch := list(islice(objs, BATCH_SIZE)):
+        model.objects.bulk_create(batch, **kwargs)
+
+
+class Command(BaseCommand):
+    help = 'Generate a reproducible synthetic dataset for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES, default='small')
+        parser.add_argument('--users', type=int,
+                            help='Override the number of users.')
+        parser.add_argument('--recipes', type=int,
+                            help='Override the number of recipes.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--subscriptions', type=int, default=10,
+                            help='Subscriptions per user.')
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Favorite recipes per user.')
+        parser.add_argument('--cart', type=int, default=5,
+                            help='Recipes in the shopping cart per user.')
+        parser.add_argument('--clear', action='store_true',
+                            help='Delete previously generated data first.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        scale = SCALES[options['scale']]
+        users_count = options['users'] or scale['users']
+        recipes_count = options['recipes'] or scale['recipes']
+
+        if options['clear']:
+            User.objects.filter(
+                email__endswith=f'@{SAMPLE_EMAIL_DOMAIN}').delete()
+        if not Ingredient.objects.exists():
+            call_command('create_ingredients')
+        if not Tag.objects.exists():
+            call_command('create_sample_tags')
+        if not default_storage.exists(SAMPLE_IMAGE_NAME):
+            default_storage.save(SAMPLE_IMAGE_NAME,
+                                 ContentFile(SAMPLE_IMAGE))
+
+        with transaction.atomic():
+            users = self.create_users(users_count)
+            recipes = self.create_recipes(rng, users, recipes_count)
+            self.create_links(rng, users, recipes, options)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {len(users)} users and {len(recipes)} recipes'))
+
+    def create_users(self, count):
+        password = make_password(SAMPLE_PASSWORD)
+        start = User.objects.filter(
+            email__endswith=f'@{SAMPLE_EMAIL_DOMAIN}').count()
+        bulk_create(
+            User,
+            (User(email=f'user{number}@{SAMPLE_EMAIL_DOMAIN}',
+                  username=f'sample_user{number}',
+                  first_name='Sample', last_name=f'User {number}',
+                  password=password)
+             for number in range(start, start + count)))
+        return list(User.objects.filter(
+            email__endswith=f'@{SAMPLE_EMAIL_DOMAIN}'
+        ).order_by('id').values_list('id', flat=True))
+
+    def create_recipes(self, rng, users, count):
+        ingredient_ids = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True))
+        tag_ids = list(Tag.objects.order_by('id').values_list('id', flat=True))
+        last_id = Recipe.objects.order_by('-id').values_list(
+            'id', flat=True).first() or 0
+        bulk_create(
+            Recipe,
+            (Recipe(author_id=rng.choice(users),
+                    name=f'Sample recipe {number}',
+                    image=SAMPLE_IMAGE_NAME,
+                    text=f'Sample recipe {number} description. ' * 5,
+                    cooking_time=rng.randint(5, 180))
+             for number in range(count)))
+        recipes = list(Recipe.objects.filter(id__gt=last_id).order_by(
+            'id').values_list('id', flat=True))
+
+        bulk_create(
+            IngredientRecipe,
+            (IngredientRecipe(recipe_id=recipe_id, ingredient_id=ingredient,
+                              amount=rng.randint(1, 500))
+             for recipe_id in recipes
+             for ingredient in rng.sample(ingredient_ids,
+                                          rng.randint(3, 12))))
+        store_ingredients(Recipe.objects.filter(id__gt=last_id))
+        bulk_create(
+            Recipe.tags.through,
+            (Recipe.tags.through(recipe_id=recipe_id, tag_id=tag)
+             for recipe_id in recipes
+             for tag in rng.sample(tag_ids,
+                                   rng.randint(1, len(tag_ids)))))
+        return recipes
+
+    def create_links(self, rng, users, recipes, options):
+        bulk_create(
+            Subscribe,
+            (Subscribe(user_id=user, author_id=author)
+             for user in users
+             for author in rng.sample(
+                 users, min(options['subscriptions'], len(users)))
+             if author != user),
+            ignore_conflicts=True)
+        for model, per_user in ((Favorite, options['favorites']),
+                                (ShoppingList, options['cart'])):
+            bulk_create(
+                model,
+                (model(user_id=user, recipe_id=recipe)
+                 for user in users
+                 for recipe in rng.sample(
+                     recipes, min(per_user, len(recipes)))),
+                ignore_conflicts=True)
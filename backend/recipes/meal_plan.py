@@ -0,0 +1,202 @@
+"""Meal plans that need as few distinct ingredients as possible.
+
+Ingredients of every recipe are kept as an int bitset, so the number
+of ingredients of a plan is a popcount of OR-ed recipes. A greedy plan
+is improved by local search, replacing one meal at a time, with random
+restarts until the time budget runs out.
+
+The catalogue of bitsets is built by the build_meal_plan_catalogue
+job after recipes change and shared through a cache, requests only
+read it.
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import IngredientRecipe, Recipe
+
+VERSION_KEY = 'meal-plan-catalogue'
+DATA_KEY = 'meal-plan-catalogue:{}'
+# Processes still loading a replaced catalogue have this long to get it.
+REPLACED_SECONDS = 60
+
+_catalogue = {'version': None, 'recipes': None}
+_lock = threading.RLock()
+
+
+class MealPlanError(Exception):
+    pass
+
+
+def get_cache():
+    return caches[settings.MEAL_PLAN['CACHE']]
+
+
+def build_catalogue():
+    """{recipe id: (ingredient bitset, cooking time, tag slugs)}.
+
+    Reads every ingredient of every recipe, three queries in total.
+    """
+    bits = {}
+    ingredients = {}
+    for recipe_id, ingredient_id in IngredientRecipe.objects.values_list(
+            'recipe_id', 'ingredient_id'):
+        bit = bits.setdefault(ingredient_id, len(bits))
+        ingredients[recipe_id] = ingredients.get(recipe_id, 0) | 1 << bit
+    tags = {}
+    for recipe_id, slug in Recipe.tags.through.objects.values_list(
+            'recipe_id', 'tag__slug'):
+        tags.setdefault(recipe_id, set()).add(slug)
+    return {
+        recipe_id: (ingredients.get(recipe_id, 0), cooking_time,
+                    frozenset(tags.get(recipe_id, ())))
+        for recipe_id, cooking_time in Recipe.objects.values_list(
+            'id', 'cooking_time')}
+
+
+def store_catalogue():
+    """Build the catalogue and hand it to every process."""
+    recipes = build_catalogue()
+    version = str(time.time_ns())
+    cache = get_cache()
+    replaced = cache.get(VERSION_KEY)
+    cache.set(DATA_KEY.format(version), recipes, None)
+    cache.set(VERSION_KEY, version, None)
+    if replaced is not None:
+        cache.touch(DATA_KEY.format(replaced), REPLACED_SECONDS)
+    with _lock:
+        _catalogue.update(version=version, recipes=recipes)
+    return recipes
+
+
+def get_catalogue():
+    """The latest stored catalogue, kept in the process until replaced.
+
+    Only when nothing was stored yet the catalogue is built here, one
+    request per process builds it while the others wait.
+    """
+    version = get_cache().get(VERSION_KEY)
+    if version is not None and version == _catalogue['version']:
+        return _catalogue['recipes']
+    with _lock:
+        # Another thread may have loaded or built it meanwhile.
+        version = get_cache().get(VERSION_KEY)
+        if version is not None and version == _catalogue['version']:
+            return _catalogue['recipes']
+        recipes = (get_cache().get(DATA_KEY.format(version))
+                   if version is not None else None)
+        if recipes is not None:
+            _catalogue.update(version=version, recipes=recipes)
+            return recipes
+        if _catalogue['recipes'] is not None:
+            # Evicted from the cache, the next job stores it again.
+            return _catalogue['recipes']
+        return store_catalogue()
+
+
+def ingredient_count(plan, catalogue):
+    union = 0
+    for recipe_id in plan:
+        union |= catalogue[recipe_id][0]
+    return union.bit_count()
+
+
+def get_candidates(catalogue, tags, max_cooking_time):
+    """Recipes for each tag, CANDIDATES with the fewest ingredients."""
+    candidates = {}
+    for tag in tags:
+        recipes = [recipe_id for recipe_id, (_, cooking_time, slugs)
+                   in catalogue.items()
+                   if tag in slugs and (max_cooking_time is None
+                                        or cooking_time <= max_cooking_time)]
+        recipes.sort(key=lambda recipe_id: (
+            catalogue[recipe_id][0].bit_count(), recipe_id))
+        candidates[tag] = recipes[:settings.MEAL_PLAN['CANDIDATES']]
+    return candidates
+
+
+def best_for_slot(others, candidates, used, catalogue, rng=None):
+    """The unused candidate adding the fewest ingredients to others."""
+    best, best_key = None, None
+    for recipe_id in candidates:
+        if recipe_id in used:
+            continue
+        bits = catalogue[recipe_id][0]
+        key = ((others | bits).bit_count(), bits.bit_count(),
+               rng.random() if rng else recipe_id)
+        if best_key is None or key < best_key:
+            best, best_key = recipe_id, key
+    return best
+
+
+def greedy(slots, candidates, catalogue, rng=None):
+    """Fill the slots one by one with the cheapest candidate.
+
+    With rng the slots are filled in random order starting from a
+    random recipe, for restarts of the search.
+    """
+    order = list(range(len(slots)))
+    if rng:
+        rng.shuffle(order)
+    plan, union = [None] * len(slots), 0
+    for index in order:
+        tag = slots[index]
+        if rng and not union and candidates[tag]:
+            recipe_id = rng.choice(candidates[tag])
+        else:
+            recipe_id = best_for_slot(
+                union, candidates[tag], set(plan), catalogue, rng)
+        if recipe_id is None:
+            raise MealPlanError(f'Not enough recipes for the tag {tag}.')
+        plan[index] = recipe_id
+        union |= catalogue[recipe_id][0]
+    return plan
+
+
+def local_search(plan, slots, candidates, catalogue, deadline):
+    """Replace single meals while that removes ingredients."""
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        for index, tag in enumerate(slots):
+            others = 0
+            for other_index, recipe_id in enumerate(plan):
+                if other_index != index:
+                    others |= catalogue[recipe_id][0]
+            current = (others | catalogue[plan[index]][0]).bit_count()
+            used = set(plan) - {plan[index]}
+            recipe_id = best_for_slot(others, candidates[tag], used, catalogue)
+            if (others | catalogue[recipe_id][0]).bit_count() < current:
+                plan[index] = recipe_id
+                improved = True
+            if time.monotonic() >= deadline:
+                break
+    return plan
+
+
+def plan_meals(tags, days, max_cooking_time=None, seed=None):
+    """Choose distinct recipes for every tag of every day.
+
+    Returns (list of days with {tag: recipe id}, number of distinct
+    ingredients). Runs for at most MEAL_PLAN['TIME_BUDGET_MS'].
+    """
+    deadline = time.monotonic() + settings.MEAL_PLAN['TIME_BUDGET_MS'] / 1000
+    catalogue = get_catalogue()
+    candidates = get_candidates(catalogue, tags, max_cooking_time)
+    slots = [tag for _ in range(days) for tag in tags]
+    best = local_search(greedy(slots, candidates, catalogue),
+                        slots, candidates, catalogue, deadline)
+    best_count = ingredient_count(best, catalogue)
+    rng = random.Random(seed)
+    while time.monotonic() < deadline:
+        plan = local_search(greedy(slots, candidates, catalogue, rng),
+                            slots, candidates, catalogue, deadline)
+        count = ingredient_count(plan, catalogue)
+        if count < best_count:
+            best, best_count = plan, count
+    meals = iter(best)
+    plan = [{tag: next(meals) for tag in tags} for _ in range(days)]
+    return plan, best_count
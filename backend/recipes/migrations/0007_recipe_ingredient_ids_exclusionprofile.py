@@ -0,0 +1,51 @@
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.conf import settings
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db import migrations, models
+from django.db.models import OuterRef
+
+
+def store_ingredient_ids(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    Recipe.objects.update(ingredient_ids=ArraySubquery(
+        IngredientRecipe.objects.filter(recipe=OuterRef('pk'))
+        .order_by('ingredient_id').values('ingredient_id')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0006_recipe_ingredients_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredient_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), default=list, editable=False, size=None, verbose_name='ID ингредиентов'),
+        ),
+        migrations.RunPython(store_ingredient_ids, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['ingredient_ids'], name='recipe_ingredient_ids_idx'),
+        ),
+        migrations.CreateModel(
+            name='ExclusionProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Название')),
+                ('ingredients', models.ManyToManyField(related_name='+', to='recipes.ingredient', verbose_name='Исключенные ингредиенты')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exclusion_profiles', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Профиль исключений',
+                'verbose_name_plural': 'Профили исключений',
+                'ordering': ('user', 'name'),
+                'constraints': [models.UniqueConstraint(fields=('user', 'name'), name='unique_exclusion_profile')],
+            },
+        ),
+    ]
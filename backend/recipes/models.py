@@ -1,3 +1,5 @@
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
 
@@ -38,11 +40,17 @@ class Tag(models.Model):
             )
         ]
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения',
+    )
 
     class Meta:
         ordering = ('name',)
         verbose_name = 'Тэг'
         verbose_name_plural = 'Тэги'
+        indexes = [models.Index(fields=('updated_at', 'id'),
+                                name='tag_updated_at_id_idx')]
 
     def __str__(self):
         return self.name
@@ -58,11 +66,17 @@ class Ingredient(models.Model):
         max_length=MAX_LENGTH_TEXT,
         verbose_name='Единицы измерения'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения',
+    )
 
     class Meta:
         ordering = ('name',)
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        indexes = [models.Index(fields=('updated_at', 'id'),
+                                name='ingredient_updated_at_id_idx')]
 
     def __str__(self):
         return self.name
@@ -104,11 +118,36 @@ class Recipe(models.Model):
         ],
         verbose_name='Время приготовления (в минутах)',
     )
+    ingredients_count = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество ингредиентов',
+    )
+    ingredient_ids = ArrayField(
+        models.BigIntegerField(),
+        default=list,
+        editable=False,
+        verbose_name='ID ингредиентов',
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения',
+    )
 
     class Meta:
         ordering = ('-id',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=('updated_at', 'id'),
+                         name='recipe_updated_at_id_idx'),
+            models.Index(fields=('cooking_time',),
+                         name='recipe_cooking_time_idx'),
+            models.Index(fields=('ingredients_count',),
+                         name='recipe_ingredients_count_idx'),
+            GinIndex(fields=('ingredient_ids',),
+                     name='recipe_ingredient_ids_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -207,3 +246,90 @@ class ShoppingList(models.Model):
 
     def __str__(self):
         return f'{self.user} - {self.recipe}'
+
+
+class Tombstone(models.Model):
+    """Deleted recipe, tag or ingredient, kept for incremental sync."""
+    stream = models.CharField(
+        max_length=20,
+        verbose_name='Поток синхронизации',
+    )
+    object_id = models.BigIntegerField(
+        verbose_name='Идентификатор объекта',
+    )
+    deleted_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата удаления',
+    )
+
+    class Meta:
+        ordering = ('deleted_at', 'id')
+        verbose_name = 'Удаленный объект'
+        verbose_name_plural = 'Удаленные объекты'
+        indexes = [models.Index(fields=('deleted_at', 'id'),
+                                name='tombstone_deleted_at_id_idx')]
+
+    def __str__(self):
+        return f'{self.stream} {self.object_id}'
+
+
+class SimilarRecipe(models.Model):
+    """Precomputed neighbor of a recipe, see recipes/similarity.py."""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт',
+    )
+    score = models.FloatField(
+        verbose_name='Сходство',
+    )
+
+    class Meta:
+        ordering = ('recipe', '-score')
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        indexes = [models.Index(fields=('recipe', '-score'),
+                                name='similar_recipe_score_idx')]
+
+    def __str__(self):
+        return f'{self.recipe} ~ {self.similar}'
+
+
+class ExclusionProfile(models.Model):
+    """Ingredients a user never wants to see in the recipe list."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='exclusion_profiles',
+        verbose_name='Пользователь',
+    )
+    name = models.CharField(
+        max_length=MAX_LENGTH_TEXT,
+        verbose_name='Название',
+    )
+    ingredients = models.ManyToManyField(
+        Ingredient,
+        related_name='+',
+        verbose_name='Исключенные ингредиенты',
+    )
+
+    class Meta:
+        ordering = ('user', 'name')
+        verbose_name = 'Профиль исключений'
+        verbose_name_plural = 'Профили исключений'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='unique_exclusion_profile',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user} {self.name}'
@@ -0,0 +1,130 @@
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from users.models import User
+
+from .models import Ingredient, IngredientRecipe, Recipe, Tag, Tombstone
+from .tasks import build_catalogue_bundle, build_meal_plan_catalogue
+
+SYNC_STREAMS = {Recipe: 'recipes', Tag: 'tags', Ingredient: 'ingredients'}
+# Fields of the author shown inside recipes.
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+# Sent with the queryset of recipes whose nested data has changed.
+recipes_touched = Signal()
+
+
+def touch_recipes(queryset):
+    """Mark recipes as changed for sync when their nested data changes."""
+    recipes_touched.send(sender=Recipe, queryset=queryset)
+    queryset.update(updated_at=timezone.now())
+
+
+def store_ingredients(queryset):
+    """Store the number and ids of ingredients of recipes for filtering."""
+    ingredients = IngredientRecipe.objects.filter(
+        recipe=OuterRef('pk')).order_by()
+    queryset.update(
+        ingredients_count=Coalesce(Subquery(ingredients.values(
+            'recipe').annotate(count=Count('id')).values('count')), 0),
+        ingredient_ids=ArraySubquery(ingredients.order_by(
+            'ingredient_id').values('ingredient_id')))
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def create_tombstone(sender, instance, **kwargs):
+    Tombstone.objects.create(stream=SYNC_STREAMS[sender],
+                             object_id=instance.pk)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def touch_tag_recipes(sender, instance, created=False, **kwargs):
+    if not created:
+        touch_recipes(Recipe.objects.filter(tags=instance))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def touch_ingredient_recipes(sender, instance, created=False, **kwargs):
+    if not created:
+        touch_recipes(Recipe.objects.filter(ingredients=instance))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def rebuild_catalogue_bundle(sender, instance, raw=False, **kwargs):
+    if not raw:
+        build_catalogue_bundle.delay()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def rebuild_meal_plan_catalogue(sender, instance, raw=False,
+                                update_fields=None, **kwargs):
+    # Touches and image updates keep ingredients, tags and cooking time.
+    if raw or (sender is Recipe and update_fields is not None
+               and 'cooking_time' not in update_fields):
+        return
+    build_meal_plan_catalogue.delay()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def rebuild_meal_plan_tags(sender, action, **kwargs):
+    if action.startswith('post_'):
+        build_meal_plan_catalogue.delay()
+
+
+@receiver(pre_save, sender=IngredientRecipe)
+def remember_recipe_ingredient(sender, instance, raw=False, **kwargs):
+    instance._stored = None if raw or instance._state.adding else (
+        IngredientRecipe.objects.filter(pk=instance.pk).values_list(
+            'recipe_id', 'ingredient_id').first())
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def update_recipe_ingredients(sender, instance, created=True, **kwargs):
+    # Amount changes keep the ingredients, the API writes with
+    # bulk_create() and stores them itself.
+    recipe_ids = {instance.recipe_id}
+    stored = getattr(instance, '_stored', None)
+    if not created:
+        current = (instance.recipe_id, instance.ingredient_id)
+        if stored is None or stored == current:
+            return
+        recipe_ids.add(stored[0])
+    store_ingredients(Recipe.objects.filter(pk__in=recipe_ids))
+
+
+@receiver(pre_save, sender=User)
+def remember_author_fields(sender, instance, raw=False, update_fields=None,
+                           **kwargs):
+    fields = AUTHOR_FIELDS if update_fields is None else (
+        AUTHOR_FIELDS & set(update_fields))
+    instance._stored_author = None if (
+        raw or instance._state.adding or not fields) else (
+        User.objects.filter(pk=instance.pk).values(*sorted(fields)).first())
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(sender, instance, created, **kwargs):
+    # Saves that keep the author fields, e.g. set_password(), skip it.
+    stored = getattr(instance, '_stored_author', None)
+    if created or not stored or all(
+            getattr(instance, name) == value
+            for name, value in stored.items()):
+        return
+    touch_recipes(Recipe.objects.filter(author=instance))
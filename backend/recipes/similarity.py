@@ -0,0 +1,148 @@
+"""Similar recipes from shared ingredients and shared fans.
+
+A recipe is a sparse vector of its ingredients and of the users who
+favorited it. The score of a pair is a weighted sum of the Jaccard
+index of ingredients and the cosine of favorites. Candidates come from
+the inverted index (recipes per ingredient or user), skipping columns
+used by more than MAX_POSTING recipes such as salt, scores are exact.
+Neighbors are stored in SimilarRecipe, so reading them is an index
+lookup.
+"""
+import heapq
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import Favorite, IngredientRecipe, SimilarRecipe
+
+
+class Vectors:
+    """Columns of every row and rows of every column of a sparse matrix."""
+
+    def __init__(self, pairs, popular):
+        self.rows = defaultdict(set)
+        self.columns = defaultdict(set)
+        for row, column in pairs:
+            self.rows[row].add(column)
+            self.columns[column].add(row)
+        self.popular = popular
+
+    def candidates(self, row):
+        rows = set()
+        for column in self.rows.get(row, ()):
+            if column not in self.popular:
+                rows |= self.columns[column]
+        return rows
+
+
+def load_all():
+    """Ingredient and favorite vectors of every recipe."""
+    limit = settings.SIMILAR_RECIPES['MAX_POSTING']
+    vectors = []
+    for model, column in ((IngredientRecipe, 'ingredient_id'),
+                          (Favorite, 'user_id')):
+        matrix = Vectors(
+            model.objects.values_list('recipe_id', column).iterator(), set())
+        matrix.popular = {key for key, rows in matrix.columns.items()
+                          if len(rows) > limit}
+        vectors.append(matrix)
+    return vectors
+
+
+def load_for(recipe_ids):
+    """Vectors of recipe_ids and of every recipe that may be similar.
+
+    Only columns of recipe_ids are counted for popularity, candidates
+    of other recipes are never looked up.
+    """
+    limit = settings.SIMILAR_RECIPES['MAX_POSTING']
+    vectors = []
+    for model, column in ((IngredientRecipe, 'ingredient_id'),
+                          (Favorite, 'user_id')):
+        own = model.objects.filter(recipe_id__in=recipe_ids).values(column)
+        popular = set(model.objects.filter(
+            **{f'{column}__in': own}).values(column).annotate(
+            count=Count('id')).filter(count__gt=limit).values_list(
+            column, flat=True))
+        columns = own.exclude(**{f'{column}__in': popular})
+        related = model.objects.filter(
+            **{f'{column}__in': columns}).values('recipe_id')
+        vectors.append(Vectors(model.objects.filter(
+            Q(recipe_id__in=related) | Q(recipe_id__in=recipe_ids)
+        ).values_list('recipe_id', column), popular))
+    return vectors
+
+
+def neighbors_of(recipe_id, ingredients, favorites):
+    """[(score, similar recipe id)] of the best NEIGHBORS recipes."""
+    weight = settings.SIMILAR_RECIPES['FAVORITES_WEIGHT']
+    own_ingredients = ingredients.rows.get(recipe_id, set())
+    own_fans = favorites.rows.get(recipe_id, set())
+    candidates = (ingredients.candidates(recipe_id)
+                  | favorites.candidates(recipe_id))
+    candidates.discard(recipe_id)
+    scored = []
+    for other in candidates:
+        other_ingredients = ingredients.rows.get(other, set())
+        other_fans = favorites.rows.get(other, set())
+        shared = len(own_ingredients & other_ingredients)
+        jaccard = (shared / len(own_ingredients | other_ingredients)
+                   if shared else 0)
+        common = len(own_fans & other_fans)
+        cosine = (common / math.sqrt(len(own_fans) * len(other_fans))
+                  if common else 0)
+        scored.append(((1 - weight) * jaccard + weight * cosine, -other))
+    return [(score, -other) for score, other in heapq.nlargest(
+        settings.SIMILAR_RECIPES['NEIGHBORS'], scored)]
+
+
+def save_neighbors(neighbors):
+    """Replace stored neighbors of the recipes in {recipe id: neighbors}."""
+    with transaction.atomic():
+        SimilarRecipe.objects.filter(recipe_id__in=neighbors).delete()
+        SimilarRecipe.objects.bulk_create([
+            SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                          score=score)
+            for recipe_id, items in neighbors.items()
+            for score, similar_id in items])
+
+
+def compute_all(recipe_ids):
+    """Compute and store neighbors of all recipes in batches."""
+    ingredients, favorites = load_all()
+    batch_size = settings.SIMILAR_RECIPES['BATCH_SIZE']
+    pairs = 0
+    for start in range(0, len(recipe_ids), batch_size):
+        neighbors = {recipe_id: neighbors_of(recipe_id, ingredients,
+                                             favorites)
+                     for recipe_id in recipe_ids[start:start + batch_size]}
+        save_neighbors(neighbors)
+        pairs += sum(map(len, neighbors.values()))
+    return pairs
+
+
+def refresh(recipe_ids):
+    """Recompute neighbors of changed recipes and of recipes around them.
+
+    Recipes that listed a changed recipe and its new neighbors get
+    fresh scores too, so both sides of a pair stay in step.
+    """
+    recipe_ids = set(recipe_ids)
+    ingredients, favorites = load_for(recipe_ids)
+    neighbors = {recipe_id: neighbors_of(recipe_id, ingredients, favorites)
+                 for recipe_id in recipe_ids}
+    around = set(SimilarRecipe.objects.filter(
+        similar_id__in=recipe_ids).values_list('recipe_id', flat=True))
+    for items in neighbors.values():
+        around.update(similar_id for _, similar_id in items)
+    around -= recipe_ids
+    if around:
+        ingredients, favorites = load_for(around)
+        neighbors.update(
+            (recipe_id, neighbors_of(recipe_id, ingredients, favorites))
+            for recipe_id in around)
+    save_neighbors(neighbors)
+    return neighbors
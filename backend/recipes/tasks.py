@@ -0,0 +1,64 @@
+from io import BytesIO
+
+from django.conf import settings
+from django.db import transaction
+from PIL import Image
+
+from jobs.queue import task
+
+from .catalogue import build_bundle
+from .meal_plan import store_catalogue
+from .models import Recipe
+from .similarity import refresh
+
+
+@task(queue='images')
+def optimize_recipe_image(recipe_id):
+    """Shrink the image of a recipe to RECIPE_IMAGE_MAX_SIZE pixels.
+
+    Uploads come as base64 straight from the phone camera, resizing
+    them in the request would hold a gunicorn worker for seconds.
+    """
+    recipe = Recipe.objects.filter(id=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+    with recipe.image.open('rb') as file:
+        image = Image.open(file)
+        image.load()
+    max_size = settings.RECIPE_IMAGE_MAX_SIZE
+    if max(image.size) <= max_size:
+        return
+    image_format = image.format
+    image.thumbnail((max_size, max_size))
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, optimize=True,
+               quality=settings.RECIPE_IMAGE_QUALITY)
+    # The original stays until the new name is committed, a failed
+    # attempt can be retried from it.
+    storage, name = recipe.image.storage, recipe.image.name
+    optimized = storage.save(name, buffer)
+    with transaction.atomic():
+        current = Recipe.objects.select_for_update().filter(
+            pk=recipe.pk).values_list('image', flat=True).first()
+        if current != name:
+            # The recipe got another image meanwhile.
+            transaction.on_commit(lambda: storage.delete(optimized))
+            return
+        recipe.image.name = optimized
+        recipe.save(update_fields=('image', 'updated_at'))
+        transaction.on_commit(lambda: storage.delete(name))
+
+
+@task(unique=True)
+def refresh_similar_recipes(recipe_id):
+    refresh([recipe_id])
+
+
+@task(unique=True)
+def build_catalogue_bundle():
+    build_bundle()
+
+
+@task(unique=True)
+def build_meal_plan_catalogue():
+    store_catalogue()
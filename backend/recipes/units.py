@@ -0,0 +1,89 @@
+"""Measurement units and ingredient names for merging amounts.
+
+Units of one dimension are converted to its base unit, amounts of
+ingredients with the same canonical name and base unit add up.
+Units without a conversion (pieces, pinches, "to taste") only merge
+with the same unit.
+"""
+from django.db.models import (Case, CharField, F, IntegerField, Max, Min, Sum,
+                              Value, When)
+from django.db.models.functions import Lower, Replace, Trim
+
+# Unit -> (base unit, how many base units it is).
+UNITS = {
+    'г': ('г', 1),
+    'кг': ('г', 1000),
+    'мл': ('мл', 1),
+    'л': ('мл', 1000),
+    'ч. л.': ('мл', 5),
+    'ст. л.': ('мл', 15),
+    'стакан': ('мл', 250),
+    'шт': ('шт.', 1),
+    'шт.': ('шт.', 1),
+}
+# (base unit, factor) -> unit, to show a total in the unit it came in.
+UNIT_NAMES = {value: unit for unit, value in UNITS.items() if unit != 'шт'}
+
+
+def canonical_name(name):
+    return ' '.join(name.lower().replace('ё', 'е').split())
+
+
+def canonical_unit(unit):
+    """(base unit, factor) of a measurement unit."""
+    unit = ' '.join(unit.lower().split())
+    return UNITS.get(unit, (unit, 1))
+
+
+def canonical_name_expression(field):
+    return Replace(Lower(Trim(field)), Value('ё'), Value('е'))
+
+
+def unit_expressions(field):
+    """SQL expressions of the base unit and the factor of a unit field."""
+    unit = Lower(Trim(field))
+    base_unit = Case(
+        *(When(**{f'{field}__iexact': name}, then=Value(base))
+          for name, (base, _) in UNITS.items()),
+        default=unit, output_field=CharField())
+    factor = Case(
+        *(When(**{f'{field}__iexact': name}, then=Value(factor))
+          for name, (_, factor) in UNITS.items() if factor != 1),
+        default=Value(1), output_field=IntegerField())
+    return base_unit, factor
+
+
+def format_amount(total, base_unit, max_factor):
+    """Show a total in the largest unit it was given in if it is whole.
+
+    1 кг + 1 кг is '2 кг', 1 кг + 500 г is '1500 г'.
+    """
+    unit = UNIT_NAMES.get((base_unit, max_factor))
+    if unit is not None and total % max_factor == 0:
+        return total // max_factor, unit
+    return total, base_unit
+
+
+def merge_amounts(queryset):
+    """Sum IngredientRecipe amounts by canonical ingredient and unit.
+
+    Returns dicts with name, amount and measurement_unit ordered by
+    name, the grouping and sums are computed by the database.
+    """
+    base_unit, factor = unit_expressions('ingredient__measurement_unit')
+    rows = queryset.annotate(
+        canonical=canonical_name_expression('ingredient__name'),
+        base_unit=base_unit,
+        factor=factor,
+    ).values('canonical', 'base_unit').annotate(
+        name=Min('ingredient__name'),
+        total=Sum(F('amount') * F('factor')),
+        max_factor=Max('factor'),
+    ).order_by('name', 'base_unit')
+    result = []
+    for row in rows:
+        amount, unit = format_amount(
+            row['total'], row['base_unit'], row['max_factor'])
+        result.append({'name': row['name'], 'amount': amount,
+                       'measurement_unit': unit})
+    return result
@@ -0,0 +1,99 @@
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+_slots = None
+_local = threading.local()
+_timeout = ContextVar('password_hashing_timeout', default=None)
+
+
+class PasswordHashingBusy(Exception):
+    """No hashing slot got free within PASSWORD_HASHING['TIMEOUT']."""
+
+    def __init__(self, wait):
+        super().__init__(f'No free password hashing slot in {wait} s.')
+        self.wait = wait
+
+
+def get_slots():
+    global _slots
+    if _slots is None:
+        _slots = threading.BoundedSemaphore(
+            settings.PASSWORD_HASHING['CONCURRENCY'])
+    return _slots
+
+
+@contextmanager
+def hashing_timeout():
+    """Give up waiting for a hashing slot after TIMEOUT seconds.
+
+    Outside the block, e.g. in the admin or management commands, hashing
+    waits for a slot as long as it takes and never fails.
+    """
+    token = _timeout.set(settings.PASSWORD_HASHING['TIMEOUT'])
+    try:
+        yield
+    finally:
+        _timeout.reset(token)
+
+
+class LimitedHashingMixin:
+    """Run at most PASSWORD_HASHING['CONCURRENCY'] hash computations at once.
+
+    A burst of logins then keeps the other cores free for the rest of
+    the traffic. Inside hashing_timeout() waiting longer than TIMEOUT
+    raises PasswordHashingBusy.
+    """
+
+    def _limited(self, compute):
+        # Scrypt and PBKDF2 verify() call encode(), take one slot only.
+        if getattr(_local, 'inside', False):
+            return compute()
+        timeout = _timeout.get()
+        if not get_slots().acquire(timeout=timeout):
+            raise PasswordHashingBusy(wait=timeout)
+        _local.inside = True
+        try:
+            return compute()
+        finally:
+            _local.inside = False
+            get_slots().release()
+
+    def encode(self, password, salt, *args, **kwargs):
+        return self._limited(
+            lambda: super(LimitedHashingMixin, self).encode(
+                password, salt, *args, **kwargs))
+
+    def verify(self, password, encoded):
+        return self._limited(
+            lambda: super(LimitedHashingMixin, self).verify(
+                password, encoded))
+
+
+class ScryptPasswordHasher(LimitedHashingMixin,
+                           hashers.ScryptPasswordHasher):
+
+    def __init__(self):
+        options = settings.PASSWORD_HASHING['SCRYPT']
+        self.work_factor = options['WORK_FACTOR']
+        self.block_size = options['BLOCK_SIZE']
+        self.parallelism = options['PARALLELISM']
+
+
+class Argon2PasswordHasher(LimitedHashingMixin,
+                           hashers.Argon2PasswordHasher):
+    """Needs the argon2-cffi package."""
+
+    def __init__(self):
+        options = settings.PASSWORD_HASHING['ARGON2']
+        self.time_cost = options['TIME_COST']
+        self.memory_cost = options['MEMORY_COST']
+        self.parallelism = options['PARALLELISM']
+
+
+class PBKDF2PasswordHasher(LimitedHashingMixin,
+                           hashers.PBKDF2PasswordHasher):
+    """Django's default, kept to verify and upgrade existing hashes."""
@@ -0,0 +1,46 @@
+import json
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hashers
+from django.core.management.base import BaseCommand
+
+PASSWORD = 'benchmark-password'
+
+
+class Command(BaseCommand):
+    help = ('Measure password checks per second on one core '
+            'for every configured hasher')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+
+    def handle(self, *args, **options):
+        results = {}
+        for hasher in get_hashers():
+            try:
+                encoded = hasher.encode(PASSWORD, hasher.salt())
+            except ValueError as error:
+                results[hasher.algorithm] = {'error': str(error)}
+                continue
+            # CPU time of this process, so the result is per core even
+            # when other work runs on the machine.
+            started = time.process_time()
+            for _ in range(options['iterations']):
+                hasher.verify(PASSWORD, encoded)
+            elapsed = time.process_time() - started
+            results[hasher.algorithm] = {
+                'hasher': f'{type(hasher).__module__}.'
+                          f'{type(hasher).__name__}',
+                'summary': {key: str(value) for key, value
+                            in hasher.safe_summary(encoded).items()
+                            if key not in ('salt', 'hash')},
+                'verify_ms': round(elapsed / options['iterations'] * 1000, 2),
+                'logins_per_second_per_core': round(
+                    options['iterations'] / elapsed, 2),
+            }
+        self.stdout.write(json.dumps({
+            'preferred': settings.PASSWORD_HASHER,
+            'concurrency': settings.PASSWORD_HASHING['CONCURRENCY'],
+            'hashers': results,
+        }, indent=2))
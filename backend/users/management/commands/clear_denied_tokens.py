@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from users.models import DeniedToken
+
+
+class Command(BaseCommand):
+    help = 'Delete expired refresh tokens from the denylist'
+
+    def handle(self, *args, **options):
+        deleted, _ = DeniedToken.objects.filter(
+            expires_at__lt=timezone.now()).delete()
+        self.stdout.write(
+            self.style.SUCCESS(f'Deleted {deleted} expired tokens'))
@@ -72,3 +72,23 @@ class Subscribe(models.Model):
         ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+
+
+class DeniedToken(models.Model):
+    """Refresh token that was rotated or logged out."""
+    jti = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Идентификатор токена',
+    )
+    expires_at = models.DateTimeField(
+        db_index=True,
+        verbose_name='Истекает',
+    )
+
+    class Meta:
+        verbose_name = 'Отозванный токен'
+        verbose_name_plural = 'Отозванные токены'
+
+    def __str__(self):
+        return self.jti